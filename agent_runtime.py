@@ -0,0 +1,186 @@
+# pip install openai
+# --- 多数の会話を1プロセスで同時にさばく非同期エージェント ---
+# これまでのエージェントは input() -> client.chat.completions.create の同期ループで、
+# 1つのプロセスが1人のユーザーの相手しかできませんでした。
+# ここでは AsyncOpenAI の上に asyncio でエージェントの中心部分を作り、
+# 独立した会話をいくつも同時に進めます。
+#   - 会話ごとに messages (履歴) を別々に持つ (会話 ID で引く)
+#   - 同じ会話の中では1ターンずつ順番に処理する (履歴が混ざらないように)
+#   - 同時に投げている chat.completions の数は、プロセス全体で max_in_flight までに制限
+#   - ツールは run_tool_calls_async で並行して実行する
+#     (ランタイムごとに専用のスレッドプールを持つ。大きさは max_tool_workers、
+#      指定しなければ max_in_flight と同じ)
+#   - history に HistoryManager を渡すと、送る前に履歴をトークン数の予算内に縮める
+#
+# 使い方:
+#   runtime = AgentRuntime(AsyncOpenAI(), tools=tools, available_functions=funcs,
+#                          system_prompt="...")
+#   answer = await runtime.chat("alice", "ビットコインの価格は？")
+#
+# python agent_runtime.py で、demo_toolcalling_gpt.py のツールを使って
+# 複数の会話を同時に進めるデモが動きます。
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from tool_executor import run_tool_calls_async
+
+MODEL = "gpt-4o"
+MAX_IN_FLIGHT = 16   # 同時に投げる chat.completions の上限 (プロセス全体)
+MAX_STEPS = 8        # 1ターンでツールを呼び直す回数の上限
+
+
+class Conversation:
+    """1つの会話の状態 (履歴と、ターンを順番に処理するためのロック)"""
+
+    def __init__(self, conversation_id, system_prompt=None):
+        self.id = conversation_id
+        self.messages = []
+        if system_prompt:
+            self.messages.append({"role": "system", "content": system_prompt})
+        self.lock = asyncio.Lock()
+        self.turns = 0
+
+
+def _assistant_message(msg):
+    """SDK のメッセージを、履歴に入れる dict にする"""
+    message = {"role": "assistant", "content": msg.content}
+    if msg.tool_calls:
+        message["tool_calls"] = [{
+            "id": tc.id,
+            "type": "function",
+            "function": {"name": tc.function.name,
+                         "arguments": tc.function.arguments},
+        } for tc in msg.tool_calls]
+    return message
+
+
+class AgentRuntime:
+    def __init__(self, client, model=MODEL, tools=None, available_functions=None,
+                 system_prompt=None, tool_timeouts=None,
+                 max_in_flight=MAX_IN_FLIGHT, max_steps=MAX_STEPS, history=None,
+                 max_tool_workers=None):
+        self.client = client  # AsyncOpenAI
+        self.model = model
+        self.tools = tools
+        self.available_functions = available_functions or {}
+        self.system_prompt = system_prompt
+        self.tool_timeouts = tool_timeouts
+        self.max_steps = max_steps
+        self.history = history  # HistoryManager (任意)
+        self.conversations = {}
+        self._slots = asyncio.Semaphore(max_in_flight)
+        # 普通の関数のツールを動かすプール (他のランタイムとは共有しない)
+        self._tool_executor = ThreadPoolExecutor(
+            max_workers=max_tool_workers or max_in_flight,
+            thread_name_prefix="agent-tool")
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.completions = 0
+        self.completion_seconds = 0.0
+
+    def conversation(self, conversation_id):
+        """会話 ID に対応する会話を返す (無ければ作る)"""
+        conv = self.conversations.get(conversation_id)
+        if conv is None:
+            conv = self.conversations[conversation_id] = Conversation(
+                conversation_id, self.system_prompt)
+        return conv
+
+    def end(self, conversation_id):
+        """会話を終えて履歴を捨てる"""
+        self.conversations.pop(conversation_id, None)
+
+    async def _compact(self, conv):
+        if self.history is None:
+            return
+        if self.history.tokens(conv.messages) > self.history.max_tokens:
+            # 要約に API を使う場合もあるので、イベントループを止めないようにスレッドで
+            conv.messages = await asyncio.to_thread(self.history.compact,
+                                                    conv.messages)
+
+    async def _complete(self, messages, use_tools=True):
+        # 上限に達していたら、どこかの会話の呼び出しが終わるまで待つ
+        async with self._slots:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            t0 = time.perf_counter()
+            try:
+                kwargs = {"model": self.model, "messages": messages}
+                if self.tools and use_tools:
+                    kwargs.update(tools=self.tools, tool_choice="auto")
+                response = await self.client.chat.completions.create(**kwargs)
+            finally:
+                self.in_flight -= 1
+                self.completions += 1
+                self.completion_seconds += time.perf_counter() - t0
+        return response.choices[0].message
+
+    async def chat(self, conversation_id, user_input):
+        """会話に1ターン分の発言を送り、最終回答のテキストを返す"""
+        conv = self.conversation(conversation_id)
+        async with conv.lock:
+            conv.messages.append({"role": "user", "content": user_input})
+            conv.turns += 1
+            for _ in range(self.max_steps):
+                await self._compact(conv)
+                msg = await self._complete(conv.messages)
+                conv.messages.append(_assistant_message(msg))
+                if not msg.tool_calls:
+                    return msg.content
+                # ツールを同時に実行し、結果を (元の順番どおりに) 履歴に追加
+                conv.messages.extend(await run_tool_calls_async(
+                    msg.tool_calls, self.available_functions,
+                    timeouts=self.tool_timeouts, executor=self._tool_executor))
+            # ツールを呼び続けて終わらない場合は、ツール無しで回答させる
+            await self._compact(conv)
+            answer = (await self._complete(conv.messages, use_tools=False)).content
+            conv.messages.append({"role": "assistant", "content": answer})
+            return answer
+
+    def close(self):
+        """ツール用のスレッドプールを片付ける (動いているツールの終了は待たない)"""
+        self._tool_executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        return {
+            "conversations": len(self.conversations),
+            "completions": self.completions,
+            "avg_completion_ms": (self.completion_seconds * 1000 / self.completions
+                                  if self.completions else 0.0),
+            "peak_in_flight": self.peak_in_flight,
+            "history": self.history.stats() if self.history else None,
+        }
+
+
+async def _demo():
+    from openai import AsyncOpenAI
+
+    import demo_toolcalling_gpt as demo
+    from history_manager import HistoryManager
+
+    runtime = AgentRuntime(
+        AsyncOpenAI(), tools=demo.tools,
+        available_functions=demo.available_functions,
+        tool_timeouts=demo.TOOL_TIMEOUTS, history=HistoryManager(max_tokens=8000),
+        system_prompt="あなたは優秀なネットワーク兼金融アシスタントです。質問には簡潔に答えてください。")
+    scripts = {
+        "alice": ["ビットコインの価格は？", "それを日本円にするとだいたいいくら？"],
+        "bob": ["私の IP アドレスはどこの国のもの？"],
+        "carol": ["ビットコインとは何か、一言で。", "いまの価格も教えて。"],
+    }
+
+    async def user(name, questions):
+        for q in questions:
+            t0 = time.perf_counter()
+            answer = await runtime.chat(name, q)
+            print(f"[{name}] ({time.perf_counter() - t0:.1f}s) {q}\n  -> {answer}")
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(user(n, qs) for n, qs in scripts.items()))
+    print(f"合計 {time.perf_counter() - t0:.1f}s  {runtime.stats()}")
+    runtime.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_demo())
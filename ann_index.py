@@ -0,0 +1,191 @@
+# pip install numpy
+# --- 近似最近傍探索 (IVF: 転置ファイル方式) ---
+# 全件と比較するかわりに、まず k-means でベクトルを n_lists 個のグループに分けておき、
+# 検索時は質問に近いグループ (nprobe 個) の中だけを比較します。
+#   nprobe を増やす -> 精度 (recall) が上がるが遅くなる
+#   nprobe を減らす -> 速いが取りこぼしが増える
+import os
+import time
+
+import numpy as np
+
+from simple_vector_store import normalize, top_k
+
+
+class IVFIndex:
+    def __init__(self, centroids, vectors, ids, offsets, nprobe=8):
+        self.centroids = centroids  # (n_lists, dim) 各グループの中心
+        # ベクトルはグループ順に並べ替えて持つ (グループ内の比較が連続アクセスになる)
+        self.vectors = vectors      # (n, dim)
+        self.ids = ids              # 並べ替え後の行 -> 元の行番号
+        self.offsets = offsets      # グループ i は [offsets[i], offsets[i+1]) の範囲
+        self.nprobe = nprobe
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, vectors, n_lists=None, n_iter=20, nprobe=8, seed=0,
+              max_train=None, block_size=65536, vectors_path=None):
+        """正規化済みベクトル (VectorStore.vectors など) から索引を作る
+
+        索引はグループ順に並べ替えたベクトルのコピーを持ちます。
+        vectors_path (.npy) を指定すると、そのコピーを RAM ではなくディスク (memmap) に
+        ブロックごとに書くので、RAM に載らない件数でも作れます。
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        n = len(vectors)
+        if n_lists is None:
+            n_lists = max(1, int(np.sqrt(n)))
+        n_lists = min(n_lists, n)
+        rng = np.random.default_rng(seed)
+
+        # k-means の学習はサンプルで十分 (1グループあたり256件程度)
+        max_train = max_train or n_lists * 256
+        if n > max_train:
+            train = vectors[np.sort(rng.choice(n, max_train, replace=False))]
+        else:
+            train = vectors
+        centroids = _kmeans(train, n_lists, n_iter, rng)
+
+        # 全件をいちばん近い中心に振り分けて、グループ順に並べ替える
+        assign = _assign(vectors, centroids, block_size)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=n_lists)
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        if vectors_path is None:
+            grouped = vectors[order]
+        else:
+            grouped = np.lib.format.open_memmap(
+                vectors_path, mode="w+", dtype=np.float32, shape=vectors.shape)
+            for start in range(0, n, block_size):
+                grouped[start:start + block_size] = vectors[
+                    order[start:start + block_size]]
+            grouped.flush()
+        return cls(centroids, grouped, order.astype(np.int64), offsets,
+                   nprobe=nprobe)
+
+    def search(self, query_vec, k=5, nprobe=None):
+        """上位k件の (元の行番号の配列, スコアの配列) をスコア降順で返す"""
+        q = normalize(query_vec)[0]
+        nprobe = min(nprobe or self.nprobe, self.n_lists)
+        lists, _ = top_k(self.centroids @ q, nprobe)
+
+        rows = np.concatenate([
+            np.arange(self.offsets[g], self.offsets[g + 1]) for g in lists
+        ])
+        if len(rows) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        idx, scores = top_k(self.vectors[rows] @ q, k)
+        return self.ids[rows[idx]], scores
+
+    # --- 保存と読み込み ---
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "centroids.npy"), self.centroids)
+        vectors_path = os.path.join(path, "vectors.npy")
+        # build(vectors_path=...) でここに直接書いたものなら、書き直さない
+        # (自分自身を開いたまま上書きすると中身が壊れる)
+        written = (isinstance(self.vectors, np.memmap)
+                   and self.vectors.filename is not None
+                   and os.path.exists(vectors_path)
+                   and os.path.samefile(self.vectors.filename, vectors_path))
+        if not written:
+            np.save(vectors_path, self.vectors)
+        np.save(os.path.join(path, "ids.npy"), self.ids)
+        np.save(os.path.join(path, "offsets.npy"), self.offsets)
+
+    @classmethod
+    def load(cls, path, mmap=True, nprobe=8):
+        """mmap=True なら並べ替え済みベクトルは memmap で開くだけにする"""
+        return cls(
+            np.load(os.path.join(path, "centroids.npy")),
+            np.load(os.path.join(path, "vectors.npy"),
+                    mmap_mode="r" if mmap else None),
+            np.load(os.path.join(path, "ids.npy")),
+            np.load(os.path.join(path, "offsets.npy")),
+            nprobe=nprobe,
+        )
+
+
+def _assign(vectors, centroids, block_size=65536):
+    """各ベクトルにいちばん近い中心の番号 (一度に block_size 行ずつ計算)"""
+    assign = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), block_size):
+        block = vectors[start:start + block_size]
+        assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assign
+
+
+def _kmeans(x, n_clusters, n_iter, rng):
+    """球面 k-means (中心も長さ1にそろえるので、内積で比べられる)"""
+    centroids = x[rng.choice(len(x), n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = _assign(x, centroids)
+        counts = np.bincount(assign, minlength=n_clusters)
+        # グループ順に並べてから区間ごとに足し合わせる (np.add.at より速い)
+        order = np.argsort(assign, kind="stable")
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        sums = np.zeros_like(centroids)
+        nonzero = counts > 0
+        sums[nonzero] = np.add.reduceat(x[order], starts[nonzero], axis=0)
+        # 空になったグループは、適当な点を選び直して復活させる
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = x[rng.choice(len(x), int(empty.sum()))]
+        centroids = normalize(sums)
+    return centroids
+
+
+def recall_report(index, vectors, queries, k=10, nprobes=(1, 2, 4, 8, 16, 32)):
+    """nprobe ごとに、総当たり検索と比べた recall@k と 1件あたりの時間を測る
+
+    戻り値は [{"nprobe", "recall", "ms_per_query"}, ...] です。
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    queries = normalize(queries)
+    exact = [set(top_k(vectors @ q, k)[0].tolist()) for q in queries]
+
+    report = []
+    for nprobe in nprobes:
+        if nprobe > index.n_lists:
+            break
+        hit = 0
+        t0 = time.perf_counter()
+        for q, truth in zip(queries, exact):
+            idx, _ = index.search(q, k=k, nprobe=nprobe)
+            hit += len(truth.intersection(idx.tolist()))
+        elapsed = time.perf_counter() - t0
+        report.append({
+            "nprobe": nprobe,
+            "recall": hit / (k * len(queries)),
+            "ms_per_query": elapsed * 1000 / len(queries),
+        })
+    return report
+
+
+if __name__ == "__main__":
+    # 話題ごとに固まったランダムなベクトルで、nprobe ごとの recall と速度を見てみる
+    rng = np.random.default_rng(0)
+    topics = rng.standard_normal((1000, 256))
+    data = topics[rng.integers(0, len(topics), 100_000)]
+    data = normalize(data + 0.5 * rng.standard_normal(data.shape))
+    queries = data[rng.choice(len(data), 100, replace=False)]
+    queries = queries + 0.1 * rng.standard_normal(queries.shape)
+
+    t0 = time.perf_counter()
+    index = IVFIndex.build(data)
+    print(f"build: {time.perf_counter() - t0:.2f}s (n_lists={index.n_lists})")
+
+    t0 = time.perf_counter()
+    for q in normalize(queries):
+        top_k(data @ q, 10)
+    brute = (time.perf_counter() - t0) * 1000 / len(queries)
+    print(f"brute force: {brute:.3f} ms/query")
+    for row in recall_report(index, data, queries, k=10):
+        print(f"nprobe={row['nprobe']:3d}  recall@10={row['recall']:.3f}"
+              f"  {row['ms_per_query']:.3f} ms/query")
@@ -0,0 +1,147 @@
+# --- 非同期 + 同時実行数制限 + 流量制御つきのベクトル化 (Gemini) ---
+# 1リクエストずつ順番に待つのではなく、asyncio で複数のリクエストを同時に投げます。
+#   - 同時に投げる数は concurrency まで (Semaphore)
+#   - 1秒あたりのリクエスト数はトークンバケットで制限し、
+#     429 / RESOURCE_EXHAUSTED が返ってきたら半分に落とし、成功が続けば少しずつ戻す
+#   - 429 や一時的なエラー (5xx・通信エラー) なら、ゆらぎ (jitter) を入れた指数バックオフで再試行
+#     (400 など、やり直しても同じ結果になるエラーは再試行しない)
+#   - 何度やってもダメだったものは dead letter として返す (黙って捨てない)
+import asyncio
+import random
+import time
+
+from batch_embedding import (GEMINI_MAX_BATCH, GEMINI_MAX_BATCH_TOKENS,
+                             iter_batches, lookup_cache)
+
+
+class AdaptiveTokenBucket:
+    """1秒あたり rate 回までに抑えるトークンバケット (429 を受けると rate を下げる)"""
+
+    def __init__(self, rate=5.0, burst=None, min_rate=0.2, max_rate=None):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate or rate * 4
+        self.capacity = burst or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity,
+                           self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1.0:
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1.0
+
+    def on_success(self):
+        # 少しずつ上げる (加算)
+        self.rate = min(self.max_rate, self.rate + 0.1)
+
+    def on_rate_limited(self):
+        # すぐに半分へ下げ、溜まっていたトークンも捨てる (乗算)
+        self._refill()
+        self.rate = max(self.min_rate, self.rate / 2)
+        self._tokens = 0.0
+
+
+def is_rate_limited(exc):
+    """429 / RESOURCE_EXHAUSTED (クォータ超過) かどうか"""
+    if getattr(exc, "code", None) == 429:
+        return True
+    text = f"{getattr(exc, 'status', '')} {exc}"
+    return "RESOURCE_EXHAUSTED" in text or "429" in text
+
+
+def is_retryable(exc):
+    """再試行して意味があるエラー (429 / 5xx / 通信エラー・タイムアウト) かどうか"""
+    if is_rate_limited(exc):
+        return True
+    code = getattr(exc, "code", None)
+    if isinstance(code, int):
+        return 500 <= code < 600
+    # 応答が返ってこなかった (接続できない・切れた・時間切れ)
+    if isinstance(exc, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    try:
+        import httpx
+    except ImportError:
+        return False
+    return isinstance(exc, httpx.TransportError)
+
+
+async def embed_documents_async(client, docs, model,
+                                task_type="RETRIEVAL_DOCUMENT",
+                                output_dimensionality=None,
+                                batch_size=GEMINI_MAX_BATCH,
+                                max_tokens=GEMINI_MAX_BATCH_TOKENS,
+                                concurrency=8, rate=5.0, max_retries=5,
+                                cache=None, bucket=None):
+    """embed_documents_gemini() の非同期版 (client.aio を使います)
+
+    戻り値は (ベクトルのリスト, dead letter のリスト) です。
+    失敗した文書の位置のベクトルは None になり、dead letter には
+    {"positions": docs の中の位置, "error": 最後の例外の文字列} が入ります。
+    """
+    from google import genai
+
+    keys = [
+        None if cache is None else cache.make_key(
+            model, task_type, doc.get("title"), output_dimensionality,
+            doc["text"])
+        for doc in docs
+    ]
+    vectors, missing = lookup_cache(cache, keys)
+    groups = {}
+    for i in missing:
+        groups.setdefault(docs[i].get("title"), []).append(i)
+
+    bucket = bucket or AdaptiveTokenBucket(rate)
+    semaphore = asyncio.Semaphore(concurrency)
+    dead_letters = []
+
+    async def embed_batch(title, batch):
+        config = genai.types.EmbedContentConfig(
+            task_type=task_type,
+            title=title,
+            output_dimensionality=output_dimensionality,
+        )
+        for attempt in range(max_retries + 1):
+            await bucket.acquire()
+            try:
+                async with semaphore:
+                    result = await client.aio.models.embed_content(
+                        model=model,
+                        contents=[docs[i]["text"] for i in batch],
+                        config=config,
+                    )
+            except Exception as e:
+                if is_rate_limited(e):
+                    bucket.on_rate_limited()
+                if attempt == max_retries or not is_retryable(e):
+                    print(f"[Error] {len(batch)} 件のベクトル化に失敗: {e}")
+                    dead_letters.append({"positions": batch, "error": str(e)})
+                    return
+                # 指数バックオフ + full jitter (一斉に再試行しないようにばらす)
+                await asyncio.sleep(random.uniform(0, min(60.0, 2 ** attempt)))
+                continue
+            bucket.on_success()
+            for i, emb in zip(batch, result.embeddings):
+                vectors[i] = emb.values
+            if cache is not None:
+                cache.put_many([(keys[i], vectors[i]) for i in batch])
+            return
+
+    await asyncio.gather(*(
+        embed_batch(title, batch)
+        for title, positions in groups.items()
+        for _, batch in iter_batches(positions, batch_size, max_tokens,
+                                     text_of=lambda i: docs[i]["text"])
+    ))
+    return vectors, dead_letters
@@ -0,0 +1,128 @@
+# --- まとめてベクトル化するためのヘルパー ---
+# 1件ずつ API を呼ぶと、埋め込みモデルの計算よりも往復の待ち時間が支配的になります。
+# ここでは複数の文書を1回の embed_content / embeddings.create に詰め込みます。
+#
+# 1リクエストあたりの上限 (目安):
+#   Gemini : 100件 / リクエスト, 合計 約2万トークン / リクエスト (1件あたり 2048トークンまで)
+#   OpenAI : 2048件 / リクエスト, 合計 約30万トークン / リクエスト
+GEMINI_MAX_BATCH = 100
+GEMINI_MAX_BATCH_TOKENS = 20_000
+OPENAI_MAX_BATCH = 2048
+OPENAI_MAX_BATCH_TOKENS = 300_000
+
+
+def estimate_tokens(text: str) -> int:
+    """ざっくりのトークン数 (API を呼ばずにローカルで数える)
+
+    英数字は 4文字で約1トークン、日本語などは 1文字で約1トークンとして数えます。
+    """
+    ascii_chars = sum(1 for c in text if c.isascii())
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+def iter_batches(items, max_items, max_tokens=None, text_of=lambda x: x):
+    """件数とトークン数の両方の上限を超えないように items を区切る
+
+    (元の並び順での開始位置, バッチ) を順に返します。
+    1件だけで max_tokens を超えるものは、そのまま単独のバッチにします。
+    """
+    batch = []
+    start = 0
+    tokens = 0
+    for i, item in enumerate(items):
+        n = estimate_tokens(text_of(item)) if max_tokens else 0
+        if batch and (len(batch) >= max_items
+                      or (max_tokens and tokens + n > max_tokens)):
+            yield start, batch
+            batch, start, tokens = [], i, 0
+        batch.append(item)
+        tokens += n
+    if batch:
+        yield start, batch
+
+
+def lookup_cache(cache, keys):
+    """キャッシュにあるものを埋めたリストと、API を呼ぶ必要がある位置を返す"""
+    vectors = [None] * len(keys)
+    if cache is None:
+        return vectors, list(range(len(keys)))
+    found = cache.get_many(keys)
+    missing = []
+    for i, key in enumerate(keys):
+        if key in found:
+            vectors[i] = found[key]
+        else:
+            missing.append(i)
+    return vectors, missing
+
+
+def embed_documents_gemini(client, docs, model,
+                           task_type="RETRIEVAL_DOCUMENT",
+                           output_dimensionality=None,
+                           batch_size=GEMINI_MAX_BATCH,
+                           max_tokens=GEMINI_MAX_BATCH_TOKENS,
+                           cache=None):
+    """{"title", "text"} の辞書のリストをまとめてベクトル化する (Gemini)
+
+    title は EmbedContentConfig 単位でしか指定できないので、
+    同じ title の文書ごとにまとめてからリクエストに詰めます。
+    cache (EmbeddingCache) を渡すと、キャッシュにない文書だけを API に送ります。
+    戻り値は docs と同じ順番のベクトル (float のリスト) のリストです。
+    """
+    from google import genai
+
+    keys = [
+        None if cache is None else cache.make_key(
+            model, task_type, doc.get("title"), output_dimensionality,
+            doc["text"])
+        for doc in docs
+    ]
+    vectors, missing = lookup_cache(cache, keys)
+    groups = {}
+    for i in missing:
+        groups.setdefault(docs[i].get("title"), []).append(i)
+
+    for title, positions in groups.items():
+        config = genai.types.EmbedContentConfig(
+            task_type=task_type,
+            title=title,
+            output_dimensionality=output_dimensionality,
+        )
+        for _, batch in iter_batches(positions, batch_size, max_tokens,
+                                     text_of=lambda i: docs[i]["text"]):
+            result = client.models.embed_content(
+                model=model,
+                contents=[docs[i]["text"] for i in batch],
+                config=config,
+            )
+            for i, emb in zip(batch, result.embeddings):
+                vectors[i] = emb.values
+            if cache is not None:
+                cache.put_many([(keys[i], vectors[i]) for i in batch])
+    return vectors
+
+
+def embed_texts_openai(client, texts, model,
+                       batch_size=OPENAI_MAX_BATCH,
+                       max_tokens=OPENAI_MAX_BATCH_TOKENS,
+                       cache=None):
+    """文字列のリストをまとめてベクトル化する (OpenAI)
+
+    cache (EmbeddingCache) を渡すと、キャッシュにないテキストだけを API に送ります。
+    戻り値は texts と同じ順番のベクトル (float のリスト) のリストです。
+    """
+    keys = [
+        None if cache is None else cache.make_key(model, None, None, None, t)
+        for t in texts
+    ]
+    vectors, missing = lookup_cache(cache, keys)
+    for _, batch in iter_batches(missing, batch_size, max_tokens,
+                                 text_of=lambda i: texts[i]):
+        response = client.embeddings.create(
+            input=[texts[i] for i in batch], model=model)
+        # data は index 付きで返ってくるので、念のため index で並べ直す
+        for d in response.data:
+            vectors[batch[d.index]] = d.embedding
+        if cache is not None:
+            cache.put_many([(keys[i], vectors[i]) for i in batch])
+    return vectors
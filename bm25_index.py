@@ -0,0 +1,160 @@
+# pip install numpy
+# --- 文字 n-gram の転置インデックス + BM25 ---
+# 日本語は単語の区切りが無いので、文字の 2-gram / 3-gram を「単語」として扱います。
+# 埋め込み検索が取りこぼしがちな「18時」「25日」のような完全一致の語を拾うための、
+# 軽い字面 (lexical) 検索です。
+#   - search()          : BM25 のスコアで上位k件
+#   - candidate_rows()  : ベクトル検索の前に候補を絞り込むための行番号
+#   - reciprocal_rank_fusion() : 複数の順位を1つにまとめる (RRF)
+#   - save() / load()   : 作った索引を保存する (大きいコーパスで毎回作り直さないように)
+import json
+import math
+import os
+import re
+import unicodedata
+from array import array
+from collections import Counter
+
+import numpy as np
+
+from simple_vector_store import top_k
+
+_SPLIT = re.compile(r"[\W_]+")
+
+
+def ngrams(text, ns=(2, 3)):
+    """正規化した文字列の n-gram のリスト (記号や空白はまたがない)"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    grams = []
+    for part in _SPLIT.split(text):
+        if len(part) < min(ns):
+            if part:
+                grams.append(part)  # 1文字だけの語もそのまま使う
+            continue
+        for n in ns:
+            grams.extend(part[i:i + n] for i in range(len(part) - n + 1))
+    return grams
+
+
+class BM25Index:
+    def __init__(self, ns=(2, 3), k1=1.2, b=0.75):
+        self.ns = ns
+        self.k1 = k1
+        self.b = b
+        # n-gram -> (行番号の配列, 出現回数の配列)。array なので 1件 4バイトで済む
+        self._postings = {}
+        self._lengths = array("i")
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def add(self, text):
+        row = len(self._lengths)
+        grams = Counter(ngrams(text, self.ns))
+        for gram, tf in grams.items():
+            posting = self._postings.get(gram)
+            if posting is None or not isinstance(posting[0], array):
+                # load() したもの (numpy の配列) は、書き足せるように array にする
+                posting = self._postings[gram] = (
+                    array("i", [] if posting is None else posting[0].tolist()),
+                    array("i", [] if posting is None else posting[1].tolist()))
+            posting[0].append(row)
+            posting[1].append(tf)
+        if not isinstance(self._lengths, array):
+            self._lengths = array("i", self._lengths.tolist())
+        self._lengths.append(sum(grams.values()))
+
+    def add_many(self, texts):
+        for text in texts:
+            self.add(text)
+
+    def scores(self, query):
+        """全行の BM25 スコア (一致する n-gram が無い行は 0)"""
+        n = len(self._lengths)
+        scores = np.zeros(n, dtype=np.float32)
+        if n == 0:
+            return scores
+        lengths = np.frombuffer(self._lengths, dtype=np.intc)
+        avgdl = max(lengths.mean(), 1.0)
+        for gram in set(ngrams(query, self.ns)):
+            posting = self._postings.get(gram)
+            if posting is None:
+                continue
+            rows = np.frombuffer(posting[0], dtype=np.intc)
+            tf = np.frombuffer(posting[1], dtype=np.intc).astype(np.float32)
+            df = len(rows)
+            idf = math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * lengths[rows] / avgdl)
+            scores[rows] += idf * tf * (self.k1 + 1.0) / (tf + norm)
+        return scores
+
+    def search(self, query, k=5, rows=None):
+        """上位k件の (行番号の配列, スコアの配列)。スコア 0 の行は返さない
+
+        rows (行番号の配列) を渡すと、その行の中から選びます。
+        """
+        scores = self.scores(query)
+        if rows is None:
+            idx, scores = top_k(scores, k)
+        else:
+            rows = np.asarray(rows, dtype=np.int64)
+            idx, scores = top_k(scores[rows], k)
+            idx = rows[idx]
+        keep = scores > 0
+        return idx[keep], scores[keep]
+
+    def candidate_rows(self, query, limit=1000, rows=None):
+        """ベクトル検索で計算する行を、字面で一致する上位 limit 行に絞る"""
+        idx, _ = self.search(query, k=limit, rows=rows)
+        return np.sort(idx)
+
+    # --- 保存と読み込み ---
+    # n-gram の一覧 (JSON) と、全 n-gram の行番号・出現回数をつないだ配列 + 区切り位置
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        grams = list(self._postings)
+        lengths = [len(self._postings[g][0]) for g in grams]
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        rows = np.empty(offsets[-1], dtype=np.intc)
+        tfs = np.empty(offsets[-1], dtype=np.intc)
+        for gram, start, end in zip(grams, offsets[:-1], offsets[1:]):
+            rows[start:end] = np.frombuffer(self._postings[gram][0], dtype=np.intc)
+            tfs[start:end] = np.frombuffer(self._postings[gram][1], dtype=np.intc)
+        np.save(os.path.join(path, "bm25_rows.npy"), rows)
+        np.save(os.path.join(path, "bm25_tfs.npy"), tfs)
+        np.save(os.path.join(path, "bm25_offsets.npy"), offsets)
+        np.save(os.path.join(path, "bm25_lengths.npy"),
+                np.frombuffer(self._lengths, dtype=np.intc))
+        with open(os.path.join(path, "bm25_grams.json"), "w", encoding="utf-8") as f:
+            json.dump({"ns": list(self.ns), "k1": self.k1, "b": self.b,
+                       "grams": grams}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """mmap=True なら行番号と出現回数の配列は memmap で開くだけにする"""
+        with open(os.path.join(path, "bm25_grams.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        mode = "r" if mmap else None
+        rows = np.load(os.path.join(path, "bm25_rows.npy"), mmap_mode=mode)
+        tfs = np.load(os.path.join(path, "bm25_tfs.npy"), mmap_mode=mode)
+        offsets = np.load(os.path.join(path, "bm25_offsets.npy"))
+        index = cls(tuple(meta["ns"]), meta["k1"], meta["b"])
+        index._lengths = np.load(os.path.join(path, "bm25_lengths.npy"))
+        for gram, start, end in zip(meta["grams"], offsets[:-1], offsets[1:]):
+            index._postings[gram] = (rows[start:end], tfs[start:end])
+        return index
+
+
+def reciprocal_rank_fusion(rankings, k=60, limit=None):
+    """複数の順位 (行番号の配列のリスト) を RRF でまとめる
+
+    各行のスコアは sum(1 / (k + 順位)) で、スコアの単位が違う検索同士でも混ぜられます。
+    (行番号の配列, RRF スコアの配列) をスコア降順で返します。
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking, start=1):
+            fused[int(row)] = fused.get(int(row), 0.0) + 1.0 / (k + rank)
+    rows = sorted(fused, key=fused.get, reverse=True)[:limit]
+    return (np.array(rows, dtype=np.int64),
+            np.array([fused[r] for r in rows], dtype=np.float32))
@@ -1,7 +1,10 @@
 #
+import time
 import tomllib
 import google.generativeai as genai
 
+from stream_output import format_timing, print_stream
+
 with open(".secrets.toml", "rb") as s:
     secrets = tomllib.load(s)
 
@@ -19,6 +22,9 @@ model = genai.GenerativeModel(
 # 1. チャットセッションを開始
 chat = model.start_chat(history=[])
 
+# 回答をストリーミングで表示するかどうか
+STREAM = True
+
 print("チャットを開始します。終了するには 'quit' と入力してください。")
 
 # 2. 無限ループでユーザーからの入力を待ち受ける
@@ -30,9 +36,16 @@ while True:
         break
 
     # 3. 履歴を考慮して応答を生成
-    response = chat.send_message(user_input)
-
-    print(f"Gemini: {response.text}")
+    #    STREAM = True なら、届いた分から順に表示します
+    started = time.perf_counter()
+    if STREAM:
+        response = chat.send_message(user_input, stream=True)
+        _, timing = print_stream(response, started=started)
+    else:
+        response = chat.send_message(user_input)
+        print(f"Gemini: {response.text}")
+        timing = {"ttft": None, "total": time.perf_counter() - started}
+    print(f"[{format_timing(timing)}]")
 
     # --- トークン数を表示するコードを追加 ---
     print("\n--- トークン情報 ---")
@@ -0,0 +1,46 @@
+# --- 回答生成に渡すコンテキストの組み立て ---
+# 検索結果を全部プロンプトに入れると、関係の薄い文まで送ることになり、
+# プロンプトの大きさも生成の待ち時間もコーパスの大きさに比例して増えてしまいます。
+# ここでは
+#   - 上位 top_k 件まで
+#   - スコアが min_score 以上のものだけ
+#   - 合計が max_tokens (ローカルで見積もったトークン数) に収まる分だけ
+# を順位の高い順に詰めます。
+from batch_embedding import estimate_tokens
+
+
+def format_passage(item):
+    return f'{item["title"]}:{item["text"]}'
+
+
+def build_context(results, max_tokens=1000, min_score=None, top_k=None,
+                  count_tokens=estimate_tokens, format=format_passage):
+    """検索結果 (順位の高い順の辞書のリスト) からプロンプトに入れる文を選ぶ
+
+    戻り値は (文のリスト, 統計) で、統計は
+      {"included", "candidates", "tokens", "candidate_tokens", "saved_tokens"}
+    です。saved_tokens は、候補を全部入れた場合と比べて減らせたトークン数です。
+    収まらない文は飛ばして、次の (短い) 文が入るかを試します。
+    """
+    passages = []
+    used = 0
+    candidate_tokens = 0
+    for rank, item in enumerate(results):
+        text = format(item)
+        n = count_tokens(text)
+        candidate_tokens += n
+        if top_k is not None and rank >= top_k:
+            continue
+        if min_score is not None and item.get("score", 0.0) < min_score:
+            continue
+        if used + n > max_tokens:
+            continue
+        passages.append(text)
+        used += n
+    return passages, {
+        "included": len(passages),
+        "candidates": len(results),
+        "tokens": used,
+        "candidate_tokens": candidate_tokens,
+        "saved_tokens": candidate_tokens - used,
+    }
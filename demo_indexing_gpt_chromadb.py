@@ -1,18 +1,32 @@
 # pip install chromadb
+import os
+import time
+
 import chromadb
 from openai import OpenAI
 
+from batch_embedding import embed_texts_openai
+from embedding_cache import EmbeddingCache
+from incremental_index import MANIFEST_FILE, sync_collection
+
 client = OpenAI()
 
+# 一度ベクトル化したテキストはディスクにキャッシュして、再実行時は API を呼ばない
+embedding_cache = EmbeddingCache()
+MODEL = "text-embedding-3-small" # 安くて高性能な最新モデル
+
 # --- 1. テキストをベクトル(数字の列)に変換する関数 ---
 # これがRAGの肝です。「意味」を「数字」に変換します。
+# 複数のテキストをまとめてベクトル化します
+# (1リクエストに最大2048件 / 約30万トークンまで詰め込みます)
+def get_embeddings(texts):
+    return embed_texts_openai(client, texts, model=MODEL,
+                              cache=embedding_cache)
+
+# 1件だけの版 (中身はまとめて版と同じ。キャッシュも共通)
 def get_embedding(text: str):
-    response = client.embeddings.create(
-        input=text,
-        model="text-embedding-3-small" # 安くて高性能な最新モデル
-    )
     # 1536次元の浮動小数点のリストが返ってきます
-    return response.data[0].embedding
+    return get_embeddings([text])[0]
 
 # --- 2. ChromaDBの準備 ---
 # ローカルの "./my_rag_db" フォルダにデータを保存する設定
@@ -30,20 +44,30 @@ documents = [
     "福利厚生：オフィス内のドリンクサーバーは無料です。金曜17時からはビールも可。",
 ]
 
-print("データをベクトル化して登録中...")
-
-# データを一つずつDBに追加
-for i, doc in enumerate(documents):
-    # (A) テキストをベクトル化
-    vector = get_embedding(doc)
-    
-    print(f"登録中: {doc[:10]}... (Vector dim: {len(vector)})")
-    
-    # (B) DBに保存
-    collection.upsert(
-        ids=[str(i)],       # ID (一意である必要あり)
-        embeddings=[vector],# ベクトルデータ (検索に使われる)
-        documents=[doc]     # 元のテキスト (検索結果として人間に見せる用)
-    )
+# 1回のベクトル化 + upsert に詰める件数
+# (Chroma 側の上限 get_max_batch_size() を超える場合はそちらに合わせます)
+BATCH_SIZE = 1000
+batch_size = min(BATCH_SIZE, chroma_client.get_max_batch_size())
+
+print(f"データをベクトル化して登録中... (バッチ {batch_size} 件)")
+
+# ID は本文のハッシュにして、前回から増えた文書だけをベクトル化・登録し、
+# 無くなった文書は DB から消します (登録済みの ID は manifest に記録)
+started = time.perf_counter()
+
+def report_progress(done, total):
+    rate = done / (time.perf_counter() - started)
+    print(f"登録中: {done}/{total} 件 ({rate:.1f} 件/秒)")
+
+result = sync_collection(
+    collection, documents, get_embeddings,
+    manifest_path=os.path.join("./my_rag_db", MANIFEST_FILE),
+    namespace=MODEL,
+    batch_size=batch_size,
+    on_batch=report_progress,
+)
+print(f"追加 {result['added']} 件 / 失敗 {result['failed']} 件"
+      f" / 削除 {result['deleted']} 件 / 変更なし {result['unchanged']} 件")
 
+print(f"キャッシュ: {embedding_cache.stats()}")
 print("完了！ './my_rag_db' フォルダに保存されました。")
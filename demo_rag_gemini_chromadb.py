@@ -1,31 +1,70 @@
 #
 # pip install google-genai chromadb
+import asyncio
+
 import chromadb
 # https://ai.google.dev/gemini-api/docs/migrate?hl=ja
 from google import genai
 import os
 import tomllib
 
+from async_embedding import AdaptiveTokenBucket, embed_documents_async
+from batch_embedding import embed_documents_gemini
+from embedding_cache import EmbeddingCache
+from incremental_index import MANIFEST_FILE, sync_collection
+
 with open(".secrets.toml", "rb") as s:
     secrets = tomllib.load(s)
 client = genai.Client(api_key=secrets.get("API_KEY"))
 
 DBNAME="./db.my_rag_gemini"
+# 一度ベクトル化した文書はディスクにキャッシュして、再実行時は API を呼ばない
+embedding_cache = EmbeddingCache()
 
 # --- 1. Embedding関数の定義 (Gemini版) ---
+# Geminiの最新Embeddingモデル (models/text-embedding-004) で、
+# DBに保存するデータを作る時は task_type に 'retrieval_document' を指定し、
+# title (任意) も付けます。documentの場合はtitleがあると精度が良い。
+# 複数の文書をまとめてベクトル化します (1リクエストに最大100件)
+# ASYNC_INGEST = True なら、複数のリクエストを同時に投げます
+# (同時実行数 CONCURRENCY、毎秒 RATE リクエストから始めて 429 が返れば自動で落とす)
+ASYNC_INGEST = True
+CONCURRENCY = 8
+RATE = 5.0
+dead_letters = []  # 何度再試行してもベクトル化できなかったもの
+# 429 を受けて下げた流量は、次のバッチ (次の asyncio.run) にも引き継ぐ
+ingest_rate = RATE
+
+def get_gemini_embeddings(texts):
+    global ingest_rate
+    docs = [{"title": '社内規定', "text": t} for t in texts]
+    if not ASYNC_INGEST:
+        return embed_documents_gemini(
+            client, docs,
+            "models/text-embedding-004",
+            task_type="retrieval_document",
+            cache=embedding_cache,
+        )
+    # バケットの中の asyncio.Lock はイベントループごとに作り直す必要があるので、
+    # バケットそのものではなく学習した rate を持ち越す
+    bucket = AdaptiveTokenBucket(ingest_rate, max_rate=RATE * 4)
+    vectors, failed = asyncio.run(embed_documents_async(
+        client, docs,
+        "models/text-embedding-004",
+        task_type="retrieval_document",
+        concurrency=CONCURRENCY,
+        cache=embedding_cache,
+        bucket=bucket,
+    ))
+    ingest_rate = bucket.rate
+    for letter in failed:
+        dead_letters.append({"texts": [texts[i] for i in letter["positions"]],
+                             "error": letter["error"]})
+    return vectors
+
+# 1件だけの版 (中身はまとめて版と同じ。キャッシュも共通)
 def get_gemini_embedding(text: str):
-    # Geminiの最新Embeddingモデル
-    model = "models/text-embedding-004"
-    
-    # embed_content メソッドを使います
-    result = client.models.embed_content(
-        model=model,
-        contents=text,
-        # 重要: DBに保存するデータを作る時は 'retrieval_document' を指定
-        config={'task_type': "retrieval_document",
-                'title': '社内規定'}  # documentの場合はtitleがあると精度が良い（任意）
-    )
-    return result.embeddings
+    return get_gemini_embeddings([text])[0]
 
 # --- 2. ChromaDBの準備 ---
 # 保存先（OpenAI版と混ざらないように）
@@ -44,20 +83,22 @@ documents = [
 
 print("Geminiでベクトル化して登録中...")
 
-for i, doc in enumerate(documents):
-    try:
-        # (A) Geminiでベクトル化 (768次元のリストが返ります)
-        vector = get_gemini_embedding(doc)[0].values
-        
-        print(f"登録中: {doc[:10]}... (Vector dim: {len(vector)})")
-        
-        # (B) DBに保存
-        collection.upsert(
-            ids=[str(i)],
-            embeddings=[vector],
-            documents=[doc]
-        )
-    except Exception as e:
-        print(f"Error: {e}")
+# ID は本文のハッシュにして、前回から増えた文書だけを
+# (A) Geminiでまとめてベクトル化 (768次元のリストが返ります) して (B) DBに保存し、
+# 無くなった文書は DB から消します (登録済みの ID は manifest に記録)
+# (ベクトル化できなかった文書は dead letter に回るので、ここで例外が出るのは
+#  DB や設定の問題。握りつぶさずにそのまま止める)
+result = sync_collection(
+    collection, documents, get_gemini_embeddings,
+    manifest_path=os.path.join(DBNAME, MANIFEST_FILE),
+    namespace="models/text-embedding-004",
+    batch_size=5000,
+)
+print(f"追加 {result['added']} 件 / 失敗 {result['failed']} 件"
+      f" / 削除 {result['deleted']} 件 / 変更なし {result['unchanged']} 件")
+
+for letter in dead_letters:
+    print(f"[Dead letter] {len(letter['texts'])} 件: {letter['error']}")
 
+print(f"キャッシュ: {embedding_cache.stats()}")
 print(f"完了！ '{DBNAME}' に保存されました。")
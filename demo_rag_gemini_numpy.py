@@ -4,8 +4,21 @@ import numpy as np
 # https://ai.google.dev/gemini-api/docs/migrate?hl=ja
 from google import genai
 import os
+import time
 import tomllib
 
+from ann_index import IVFIndex
+from batch_embedding import GEMINI_MAX_BATCH, embed_documents_gemini, iter_batches
+from bm25_index import BM25Index, reciprocal_rank_fusion
+from context_builder import build_context
+from embedding_cache import EmbeddingCache
+from matryoshka_index import PrefixIndex
+from query_cache import QueryEmbeddingCache
+from quantized_index import BinaryIndex, Int8Index
+from simple_vector_store import (VectorStore, content_digest, load_fingerprint,
+                                 save_fingerprint)
+from stream_output import format_timing, print_stream
+
 with open(".secrets.toml", "rb") as s:
     secrets = tomllib.load(s)
 client = genai.Client(api_key=secrets.get("API_KEY"))
@@ -13,21 +26,27 @@ client = genai.Client(api_key=secrets.get("API_KEY"))
 # --- 2. ベクトル化関数 (Gemini) ---
 OUTPUT_DIMENSIONALITY = None
 MODEL = "models/text-embedding-004"
-def get_embedding(doc):
-    result = client.models.embed_content(
-        model=MODEL,
-        contents=doc['text'],
-        config=genai.types.EmbedContentConfig(
-            task_type="RETRIEVAL_DOCUMENT",
-            title=doc['title'],
-            output_dimensionality=OUTPUT_DIMENSIONALITY,
-        ),
+# 一度ベクトル化した文書はディスクにキャッシュして、再実行時は API を呼ばない
+embedding_cache = EmbeddingCache()
+
+# 複数の文書をまとめて (1リクエストに最大100件) ベクトル化します
+def get_embeddings(docs):
+    vectors = embed_documents_gemini(
+        client, docs, MODEL,
+        task_type="RETRIEVAL_DOCUMENT",
+        output_dimensionality=OUTPUT_DIMENSIONALITY,
+        cache=embedding_cache,
     )
-    return np.array(result.embeddings[0].values)
+    return np.array(vectors)
 
-# --- 3. 自作データベース (ただのリスト) ---
-# ここに辞書形式でデータを詰め込みます
-my_simple_db = []
+# 1件だけの版 (中身はまとめて版と同じ。キャッシュも共通)
+def get_embedding(doc):
+    return get_embeddings([doc])[0]
+
+# --- 3. 自作データベース (行列版ベクトルストア) ---
+# 正規化済みベクトルを1本の行列に、title/text を並列配列に持ちます
+# 一度ベクトル化したら STORE_PATH に保存し、次回からは memmap で開くだけにします
+STORE_PATH = "./db.my_rag_numpy"
 
 documents = [
     {"title": "交通費規定", "text": "自宅から会社までの往復運賃を月額上限5万円まで全額支給します。"},
@@ -37,58 +56,187 @@ documents = [
     {"title": "福利厚生", "text": "オフィス内のドリンクサーバーは無料です。金曜17時からはビールも可。"},
 ]
 
-print("データをベクトル化してメモリに保存中...")
+# 保存済みのストアが上の documents から作ったもので、documents が書き換えられていたら
+# 古いベクトルを検索しないように作り直します (変わっていない文書はキャッシュから取るので安い)。
+# ingest_pipeline.py で作ったストアなど、別の所から作ったものはそのまま使います。
+# (source が無いのは、これを入れる前にこのスクリプトが保存したストアです)
+my_simple_db = None
+if os.path.exists(STORE_PATH):
+    stored = VectorStore.load(STORE_PATH)
+    documents_digest = content_digest([doc['title'] for doc in documents],
+                                      [doc['text'] for doc in documents])
+    if (stored.source in (None, "documents")
+            and stored.fingerprint()["content"] != documents_digest):
+        print(f"documents が '{STORE_PATH}' と違うので、ベクトル化し直します。")
+        del stored  # 上書きする前に memmap を手放す
+    else:
+        print(f"'{STORE_PATH}' からベクトルを読み込みます (memmap)...")
+        my_simple_db = stored
 
-for doc in documents:
-    # ベクトル化
-    vector = get_embedding(doc)
-    
-    # リストに追加 (これがDBへの保存と同じこと)
-    my_simple_db.append({
-        "text": doc['text'],
-        "title": doc['title'],
-        "vector": vector
-    })
+if my_simple_db is None:
+    print("データをベクトル化してメモリに保存中...")
+    my_simple_db = VectorStore()
+    my_simple_db.source = "documents"
+
+    # 1件ずつではなく、まとめてベクトル化して一括で追加
+    vectors = get_embeddings(documents)
+    my_simple_db.add_many(
+        [doc['title'] for doc in documents],
+        [doc['text'] for doc in documents],
+        vectors,
+    )
+    my_simple_db.save(STORE_PATH)
+    print(f"キャッシュ: {embedding_cache.stats()}")
 
 print(f"完了。{len(my_simple_db)}件のデータを保持しています。\n")
 
+# IVF や量子化などの派生した索引は、作ったときのストアの fingerprint と一緒に保存し、
+# ストアが作り直されていたら (行番号がずれるので) 読み込まずに作り直します
+store_fingerprint = my_simple_db.fingerprint()
+
+def index_is_current(path):
+    return os.path.exists(path) and load_fingerprint(path) == store_fingerprint
+
+# 件数が多いときは IVF 索引 (近似最近傍探索) を使う。5件程度なら総当たりで十分です。
+# 精度と速度の兼ね合いは nprobe で調整します (python ann_index.py で目安を確認)
+ANN_MIN_SIZE = 100_000
+ANN_PATH = os.path.join(STORE_PATH, "ivf")
+ann_index = None
+if len(my_simple_db) >= ANN_MIN_SIZE:
+    if index_is_current(ANN_PATH):
+        ann_index = IVFIndex.load(ANN_PATH)
+    else:
+        ann_index = IVFIndex.build(my_simple_db.vectors)
+        ann_index.save(ANN_PATH)
+        save_fingerprint(ANN_PATH, store_fingerprint)
+
+# 量子化して持つ場合は "int8" (1/4) か "binary" (1/32) を指定します。
+# 粗いスコアで候補を絞ってから、memmap 上の元のベクトルで計算し直します。
+QUANTIZATION = None
+quantized_index = None
+if QUANTIZATION is not None:
+    quantized_cls = {"int8": Int8Index, "binary": BinaryIndex}[QUANTIZATION]
+    quantized_path = os.path.join(STORE_PATH, QUANTIZATION)
+    if index_is_current(quantized_path):
+        quantized_index = quantized_cls.load(
+            quantized_path, full_vectors=my_simple_db.vectors)
+    else:
+        quantized_index = quantized_cls.build(
+            my_simple_db.vectors, full_vectors=my_simple_db.vectors)
+        quantized_index.save(quantized_path)
+        save_fingerprint(quantized_path, store_fingerprint)
+
+# 全次元のベクトルは残したまま、先頭 PREFIX_DIMS 次元 (例: 128) だけで候補を絞り、
+# 候補を全次元で並べ直す2段階検索にする場合に指定します。
+# 長さごとの精度と速度は python matryoshka_index.py で目安を確認できます。
+PREFIX_DIMS = None
+prefix_index = None
+if PREFIX_DIMS is not None:
+    prefix_index = PrefixIndex(my_simple_db.vectors, PREFIX_DIMS)
+
 
 # --- 4. 検索エンジンの心臓部 (コサイン類似度) ---
 # これが ChromaDB の中で行われている計算の正体です。
-def cosine_similarity(v1, v2):
-    # 内積をとって、長さで割る = 角度の近さを計算
-    return np.dot(v1, v2) / (np.linalg.norm(v1) * np.linalg.norm(v2))
+# ストアのベクトルは正規化済みなので、内積をとるだけで角度の近さになります。
+TOP_K = 5
+
+# 埋め込みだけだと「18時」「25日」のような完全一致の語を取りこぼすので、
+# 文字 n-gram の BM25 (字面検索) も作っておき、2つの順位を RRF で混ぜます。
+# 作るのは全文書を読む重い処理なので、IVF などと同じくストアの隣に保存しておき、
+# ストアが変わっていなければ読み込むだけにします。
+BM25_PATH = os.path.join(STORE_PATH, "bm25")
+if index_is_current(BM25_PATH):
+    lexical_index = BM25Index.load(BM25_PATH)
+else:
+    lexical_index = BM25Index()
+    lexical_index.add_many(
+        f"{title} {text}"
+        for title, text in zip(my_simple_db.titles, my_simple_db.texts))
+    lexical_index.save(BM25_PATH)
+    save_fingerprint(BM25_PATH, store_fingerprint)
+HYBRID_DEPTH = 50  # それぞれの検索から上位何件を RRF に回すか
+# 数字を入れると、字面で一致する上位 LEXICAL_PREFILTER 行だけをベクトルで計算します
+LEXICAL_PREFILTER = None
+
+# 質問文のベクトルは、正規化した質問文とモデル名をキーにしてプロセス内で覚えておく
+# (ディスクにも残したい場合は persist=embedding_cache を渡す)
+query_cache = QueryEmbeddingCache(max_entries=1024)
+
+def embed_queries(texts):
+    """質問文のリストをまとめてベクトル化する（task_typeはqueryにする）
+
+    1リクエストに入れられるのは GEMINI_MAX_BATCH 件までなので、それごとに区切ります。
+    """
+    vectors = []
+    for _, batch in iter_batches(list(texts), GEMINI_MAX_BATCH):
+        result = client.models.embed_content(
+            model=MODEL,
+            contents=batch,
+            config=genai.types.EmbedContentConfig(
+                task_type="RETRIEVAL_QUERY",
+                output_dimensionality=OUTPUT_DIMENSIONALITY),
+        )
+        vectors.extend(e.values for e in result.embeddings)
+    return vectors
+
+def search_vectors(query_vec, k, rows=None):
+    if rows is not None:
+        return my_simple_db.search(query_vec, k=k, rows=rows)
+    if ann_index is not None:
+        return ann_index.search(query_vec, k=k)
+    if quantized_index is not None:
+        return quantized_index.search(query_vec, k=k)
+    if prefix_index is not None:
+        return prefix_index.search(query_vec, k=k)
+    return my_simple_db.search(query_vec, k=k)
 
-def search(query_text):
+def search(query_text, k=TOP_K, title=None):
+    """title (例: "リモートワーク規定" やそのリスト) を渡すと、その規定の中だけを探す"""
     print(f"[System] 検索クエリ: {query_text}")
     
-    # (A) 質問をベクトル化（task_typeはqueryにする）
-    result = client.models.embed_content(
-        model=MODEL,
-        contents=query_text,
-        config=genai.types.EmbedContentConfig(
-            task_type="RETRIEVAL_QUERY",
-            output_dimensionality=OUTPUT_DIMENSIONALITY),
-    )
-    query_vec = np.array(result.embeddings[0].values)
+    # (A) 質問をベクトル化（同じ質問は覚えておいて API を呼ばない）
+    query_vec = np.array(query_cache.get_or_embed(
+        MODEL, query_text, lambda text: embed_queries([text])[0],
+        output_dimensionality=OUTPUT_DIMENSIONALITY))
+
+    # title で絞り込む場合は、あらかじめ作ってある title -> 行番号 の表から
+    # 対象の行を取り出し、その行だけを計算します (全件を計算してから捨てない)
+    allowed = None
+    if title is not None:
+        allowed = my_simple_db.metadata.rows(title=title)
+
+    # (B) 字面検索で上位を取る (プレフィルタにする場合はここで候補行を決める)
+    depth = max(k, HYBRID_DEPTH)
+    lexical_idx, _ = lexical_index.search(query_text, k=depth, rows=allowed)
+    rows = allowed
+    if LEXICAL_PREFILTER is not None:
+        candidates = lexical_index.candidate_rows(
+            query_text, LEXICAL_PREFILTER, rows=allowed)
+        if len(candidates) > 0:
+            rows = candidates  # 字面で1件も一致しなければベクトルだけで探す
 
-    # (B) 全データと比較計算
+    # (C) ベクトル検索で上位を取り、2つの順位を RRF でまとめて上位k件にする
+    vector_idx, _ = search_vectors(query_vec, depth, rows=rows)
+    idx, rrf_scores = reciprocal_rank_fusion([vector_idx, lexical_idx], limit=k)
+    scores = my_simple_db.score_rows(query_vec, idx)
     results = []
-    for item in my_simple_db:
-        # ここで類似度スコアを計算！
-        score = cosine_similarity(query_vec, item['vector'])
-        results.append({
-            "title": item['title'],
-            "text": item['text'],
-            "score": score
-        })
-    
-    # (C) スコアが高い順に並び替え
-    results.sort(key=lambda x: x['score'], reverse=True)
+    for i, score, rrf in zip(idx, scores, rrf_scores):
+        item = my_simple_db.get(i, score)
+        item["rrf"] = float(rrf)
+        results.append(item)
     for x in results:
         print(x['score'], x['title'], x['text'])
     return results
 
+# 複数の質問をまとめて検索する版 (オフライン評価や、サブクエリを投げるエージェント向け)
+# 質問は1回のリクエストでまとめてベクトル化し、行列×行列1回でスコアを計算します。
+# 戻り値は (質問数, k) の行番号の配列とスコアの配列です (表示や辞書の作成はしません)。
+def search_many(queries, k=TOP_K):
+    query_vecs = np.array(query_cache.get_many_or_embed(
+        MODEL, list(queries), embed_queries,
+        output_dimensionality=OUTPUT_DIMENSIONALITY))
+    return my_simple_db.search_many(query_vecs, k=k)
+
 # --- 5. 実行してみる ---
 user_query = "リモートワークっていつまでに申請？"
 top_result = search(user_query)
@@ -99,8 +247,20 @@ print(f"タイトル: {top_result[0]['title']}")
 print(f"内容: {top_result[0]['text']}")
 print("-" * 30)
 
-t = [f'{x["title"]}:{x["text"]}' for x in top_result]
+# 関係の薄い結果まで全部入れないように、スコアの閾値とトークン数の上限で絞る
+CONTEXT_TOP_K = 3
+CONTEXT_MIN_SCORE = 0.3
+CONTEXT_MAX_TOKENS = 1000
+t, context_stats = build_context(
+    top_result,
+    max_tokens=CONTEXT_MAX_TOKENS,
+    min_score=CONTEXT_MIN_SCORE,
+    top_k=CONTEXT_TOP_K,
+)
 print(t)
+print(f"コンテキスト: {context_stats['included']}/{context_stats['candidates']} 件,"
+      f" {context_stats['tokens']} トークン"
+      f" ({context_stats['saved_tokens']} トークン節約)")
 # --- 6. 生成AIに回答させる ---
 print("Geminiに回答を生成させます...")
 prompt = f"""
@@ -108,7 +268,19 @@ prompt = f"""
 情報: {t}
 質問: {user_query}
 """
-response = client.models.generate_content(
-    model='gemini-flash-latest',
-    contents=prompt)
-print(f"Gemini: {response.text}")
+# STREAM = True なら、回答を届いた分から順に表示します
+STREAM = True
+started = time.perf_counter()
+if STREAM:
+    _, timing = print_stream(
+        client.models.generate_content_stream(
+            model='gemini-flash-latest',
+            contents=prompt),
+        started=started)
+else:
+    response = client.models.generate_content(
+        model='gemini-flash-latest',
+        contents=prompt)
+    print(f"Gemini: {response.text}")
+    timing = {"ttft": None, "total": time.perf_counter() - started}
+print(f"[{format_timing(timing)}]")
@@ -2,21 +2,66 @@
 ## リモートワークは何時までに申請すればいい？
 ## お酒飲んでもいいんだっけ？
 ##
-import json
-import chromadb
 from openai import OpenAI
 
+from query_cache import QueryEmbeddingCache
+from retrieval_server import RetrievalClient
+from semantic_cache import SemanticCache
+from tool_executor import run_tool_calls
+
 client = OpenAI()
 
-# --- 1. ChromaDBへの接続 ---
-chroma_client = chromadb.PersistentClient(path="./my_rag_db")
-collection = chroma_client.get_collection(name="company_knowledge")
+# --- 1. 検索サーバーへの接続 ---
+# python retrieval_server.py で常駐サーバーを立てておけば、コレクションの読み込みも
+# 質問ベクトルのキャッシュもサーバー側で温まったままになり、ここは問い合わせるだけです。
+# サーバーが居なければ、このプロセスで ChromaDB を開いて検索します。
+retrieval_client = RetrievalClient()
+
+_collection = None
+
+def get_collection():
+    global _collection
+    if _collection is None:
+        import chromadb
+        chroma_client = chromadb.PersistentClient(path="./my_rag_db")
+        _collection = chroma_client.get_collection(name="company_knowledge")
+    return _collection
 
 # --- 2. 埋め込み関数の再定義 ---
+EMBEDDING_MODEL = "text-embedding-3-small"
+
 def get_embedding(text: str):
-    resp = client.embeddings.create(input=text, model="text-embedding-3-small")
+    resp = client.embeddings.create(input=text, model=EMBEDDING_MODEL)
     return resp.data[0].embedding
 
+# 同じ質問 (空白や全角半角の違いは無視) はベクトル化し直さない
+query_cache = QueryEmbeddingCache(max_entries=1024)
+
+# 言い回しが違うだけの質問 (ベクトルのコサイン類似度が閾値以上) には、前の結果を返す
+#   retrieval_cache : 検索結果 (サーバーが居ないときの、このプロセス内の検索用)
+#   answer_cache    : 最終回答。会話の流れに依存しない単発の質問向けなので、
+#                     ANSWER_CACHE = True のときだけ、会話の最初の質問にだけ使う
+#                     (「詳しく教えて」のような続きの質問は、前の話題によって答えが変わるため)
+retrieval_cache = SemanticCache(threshold=0.95, max_entries=1000, ttl=600.0)
+ANSWER_CACHE = False
+answer_cache = SemanticCache(threshold=0.97, max_entries=1000, ttl=3600.0)
+
+def search_local(query: str, n_results: int):
+    # (A) 質問文をベクトル化
+    query_vector = query_cache.get_or_embed(EMBEDDING_MODEL, query, get_embedding)
+    cached = retrieval_cache.lookup(query_vector)
+    if cached is not None and len(cached) >= n_results:
+        return cached[:n_results]
+    
+    # (B) ベクトル同士の距離が近いものを検索 (Cos類似度など)
+    results = get_collection().query(
+        query_embeddings=[query_vector],
+        n_results=n_results
+    )
+    found_texts = results['documents'][0] # リストのリストになっているので[0]
+    retrieval_cache.put(query_vector, found_texts)
+    return found_texts
+
 # --- 3. ツール: 社内知識の検索 (Retrieval) ---
 def search_internal_knowledge(query: str):
     """
@@ -24,17 +69,10 @@ def search_internal_knowledge(query: str):
     """
     print(f"\n[System] RAG検索実行: '{query}'")
     
-    # (A) 質問文をベクトル化
-    query_vector = get_embedding(query)
-    
-    # (B) ベクトル同士の距離が近いものを検索 (Cos類似度など)
-    results = collection.query(
-        query_embeddings=[query_vector],
-        n_results=2 # 上位2件を取得
-    )
-    
-    # 結果の整形
-    found_texts = results['documents'][0] # リストのリストになっているので[0]
+    try:
+        found_texts = retrieval_client.search(query, n_results=2) # 上位2件を取得
+    except OSError:
+        found_texts = search_local(query, n_results=2)
     
     if not found_texts:
         return "関連する情報は見つかりませんでした。"
@@ -68,13 +106,31 @@ def main():
         {"role": "system", "content": "あなたは社内の総務アシスタントです。わからないことはツールを使って調べてください。"}
     ]
     print("=== Internal Wiki AI (type 'exit' to quit) ===")
+    turns = 0
 
     while True:
         user_input = input("\nUser: ").strip()
-        if user_input.lower() == "exit": break
+        if user_input.lower() == "exit":
+            print(f"[System] 質問ベクトルのキャッシュ: {query_cache.stats()}")
+            print(f"[System] 検索結果のキャッシュ: {retrieval_cache.stats()}")
+            print(f"[System] 回答のキャッシュ: {answer_cache.stats()}")
+            break
         if not user_input: continue
 
         messages.append({"role": "user", "content": user_input})
+        turns += 1
+
+        # 似た質問に最近答えていれば、gpt-4o を呼ばずにその回答を返す
+        # (履歴に頼らない、会話の最初の質問のときだけ)
+        use_answer_cache = ANSWER_CACHE and turns == 1
+        if use_answer_cache:
+            question_vector = query_cache.get_or_embed(
+                EMBEDDING_MODEL, user_input, get_embedding)
+            cached_answer = answer_cache.lookup(question_vector)
+            if cached_answer is not None:
+                print(f"\nAI (キャッシュ): {cached_answer}")
+                messages.append({"role": "assistant", "content": cached_answer})
+                continue
 
         # --- AI Agent Loop ---
         while True:
@@ -91,26 +147,18 @@ def main():
             if tool_calls:
                 messages.append(msg)
                 
-                for tool_call in tool_calls:
-                    fname = tool_call.function.name
-                    fargs = json.loads(tool_call.function.arguments)
-                    
-                    if fname == "search_internal_knowledge":
-                        # ツール実行
-                        result = search_internal_knowledge(query=fargs["query"])
-                        
-                        messages.append({
-                            "tool_call_id": tool_call.id,
-                            "role": "tool",
-                            "name": fname,
-                            "content": result
-                        })
+                # ツールを同時に実行し、結果を (元の順番どおりに) 履歴に追加
+                messages.extend(run_tool_calls(
+                    tool_calls, available_functions,
+                    timeouts={"search_internal_knowledge": 30.0}))
                 # ループ継続（検索結果を持って再考）
                 continue
             
             else:
                 print(f"\nAI: {msg.content}")
                 messages.append({"role": "assistant", "content": msg.content})
+                if use_answer_cache:
+                    answer_cache.put(question_vector, msg.content)
                 break
 
 if __name__ == "__main__":
@@ -1,5 +1,5 @@
 #
-import requests
+import http_pool
 from bs4 import BeautifulSoup
 import json
 
@@ -28,7 +28,7 @@ def get_google_news_articles(query: str) -> str:
     }
 
     # 1. HTMLの取得
-    response = requests.get(url, headers=headers)
+    response = http_pool.get(url, headers=headers)
     response.raise_for_status()  # エラーがあればここで例外を発生させる
 
     # 2. HTMLの解析 (Beautiful Soupの出番)
@@ -1,7 +1,11 @@
 import json
-import httpx
 from openai import OpenAI
 
+import http_pool
+from history_manager import HistoryManager
+from tool_cache import ToolResultCache
+from tool_executor import run_tool_calls
+
 # APIキー設定 (環境変数推奨)
 client = OpenAI()
 
@@ -10,13 +14,13 @@ def get_bitcoin_price(currency: str = "USD"):
     """現在のビットコイン価格を取得する"""
     url = "https://api.coindesk.com/v1/bpi/currentprice.json"
     try:
-        with httpx.Client(timeout=10.0) as http:
-            resp = http.get(url)
-            resp.raise_for_status()
-            data = resp.json()
-            # 簡略化のためレートのみ抽出
-            rate = data["bpi"]["USD"]["rate"]
-            return json.dumps({"currency": "USD", "price": rate})
+        # 接続を使い回すため、共有のクライアントを使う
+        resp = http_pool.get(url)
+        resp.raise_for_status()
+        data = resp.json()
+        # 簡略化のためレートのみ抽出
+        rate = data["bpi"]["USD"]["rate"]
+        return json.dumps({"currency": "USD", "price": rate})
     except Exception as e:
         return json.dumps({"error": str(e)})
 
@@ -25,18 +29,17 @@ def get_current_ip_info():
     """現在のIPアドレスと、そこから推測される国・都市情報を取得する"""
     url = "http://ip-api.com/json/"
     try:
-        with httpx.Client(timeout=10.0) as http:
-            resp = http.get(url)
-            resp.raise_for_status()
-            data = resp.json()
-            # 必要な情報だけ選別して返す
-            result = {
-                "ip": data.get("query"),
-                "country": data.get("country"),
-                "city": data.get("city"),
-                "isp": data.get("isp")
-            }
-            return json.dumps(result)
+        resp = http_pool.get(url)
+        resp.raise_for_status()
+        data = resp.json()
+        # 必要な情報だけ選別して返す
+        result = {
+            "ip": data.get("query"),
+            "country": data.get("country"),
+            "city": data.get("city"),
+            "isp": data.get("isp")
+        }
+        return json.dumps(result)
     except Exception as e:
         return json.dumps({"error": str(e)})
 
@@ -70,11 +73,30 @@ tools = [
 ]
 
 # 実行する関数をマッピング
+# 結果を使い回す期間 (秒)。価格はすぐ変わるので短く、IP 情報は長めに
+TOOL_TTLS = {
+    "get_bitcoin_price": 30.0,
+    "get_current_ip_info": 600.0,
+}
+# ファイル名を指定すると、プロセスをまたいで結果を使い回す (例: "./tool_cache.sqlite3")
+TOOL_CACHE_PATH = None
+tool_cache = ToolResultCache(ttls=TOOL_TTLS, path=TOOL_CACHE_PATH)
+
 available_functions = {
-    "get_bitcoin_price": get_bitcoin_price,
-    "get_current_ip_info": get_current_ip_info,
+    "get_bitcoin_price": tool_cache.wrap(get_bitcoin_price),
+    "get_current_ip_info": tool_cache.wrap(get_current_ip_info),
 }
 
+# ツールごとのタイムアウト (秒)
+TOOL_TIMEOUTS = {
+    "get_bitcoin_price": 15.0,
+    "get_current_ip_info": 15.0,
+}
+
+# 会話履歴の予算 (ローカルで見積もったトークン数)
+# 超えたら古いツールの結果を切り詰め、古いターンは要約にまとめる
+history = HistoryManager(max_tokens=8000, tool_output_tokens=300)
+
 def main():
     # 会話履歴を保持するリスト (Systemプロンプトでキャラ付け)
     messages = [
@@ -88,7 +110,7 @@ def main():
         # ユーザー入力の受付
         user_input = input("\nUser: ").strip()
         if user_input.lower() == "exit":
-            print("System: 終了します。")
+            print(f"System: 終了します。ツールのキャッシュ: {tool_cache.stats()}")
             break
         if not user_input:
             continue
@@ -98,6 +120,7 @@ def main():
 
         # --- 1回目のAPI呼び出し (回答またはツール要求) ---
         try:
+            messages = history.compact(messages)
             response = client.chat.completions.create(
                 model="gpt-4o", # gpt-3.5-turbo 等でも可
                 messages=messages,
@@ -118,31 +141,13 @@ def main():
             # 1. AIの「ツールを使いたい」という思考を履歴に追加 (必須)
             messages.append(response_message)
             
-            # 2. 要求された全ツールを実行 (並列呼び出し対応)
-            for tool_call in tool_calls:
-                function_name = tool_call.function.name
-                function_to_call = available_functions.get(function_name)
-                
-                if function_to_call:
-                    # 引数があればパース（今回はあまり使いませんが汎用的に）
-                    function_args = json.loads(tool_call.function.arguments)
-                    
-                    print(f"[System] Tool Calling: {function_name} ...")
-                    
-                    # 関数実行
-                    function_response = function_to_call(**function_args)
-                    
-                    # 3. 実行結果を履歴に追加
-                    messages.append(
-                        {
-                            "tool_call_id": tool_call.id,
-                            "role": "tool",
-                            "name": function_name,
-                            "content": function_response,
-                        }
-                    )
+            # 2. 要求された全ツールを同時に実行し、
+            # 3. 実行結果を (元の順番どおりに) 履歴に追加
+            messages.extend(run_tool_calls(
+                tool_calls, available_functions, timeouts=TOOL_TIMEOUTS))
             
             # 4. ツールの結果を踏まえて、もう一度AIに回答を生成させる
+            messages = history.compact(messages)
             second_response = client.chat.completions.create(
                 model="gpt-4o",
                 messages=messages,
@@ -1,12 +1,25 @@
 import json
-import httpx
 from openai import OpenAI
 from duckduckgo_search import DDGS
 from bs4 import BeautifulSoup
+
+from history_manager import HistoryManager
+from tool_cache import ToolResultCache, charset_of
+from tool_executor import run_tool_calls
 #ex 「昨日の日経平均の終値と、主な値動きの要因を詳しく教えて」
 
 client = OpenAI()
 
+# 結果を使い回す期間 (秒)。ページは期限が切れても ETag / Last-Modified で確かめて、
+# 変わっていなければ取り直さない
+TOOL_TTLS = {
+    "web_search": 300.0,
+    "visit_web_page": 600.0,
+}
+# ファイル名を指定すると、プロセスをまたいで結果を使い回す (例: "./tool_cache.sqlite3")
+TOOL_CACHE_PATH = None
+tool_cache = ToolResultCache(ttls=TOOL_TTLS, path=TOOL_CACHE_PATH)
+
 # --- ツール1: Web検索 ---
 def web_search(query: str):
     """Web検索を行い、URLとタイトルのリストを返します。"""
@@ -30,26 +43,29 @@ def visit_web_page(url: str):
         headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
         }
-        with httpx.Client(timeout=10.0, follow_redirects=True, headers=headers) as client:
-            resp = client.get(url)
-            resp.raise_for_status()
-            
-            # HTMLからテキストを抽出
-            soup = BeautifulSoup(resp.content, "html.parser")
-            
-            # scriptやstyleタグを除去
-            for script in soup(["script", "style"]):
-                script.decompose()
-            
-            text = soup.get_text(separator="\n")
-            
-            # 空白行を削除して整形
-            lines = [line.strip() for line in text.splitlines() if line.strip()]
-            clean_text = "\n".join(lines)
-            
-            # 長すぎるとトークン制限にかかるので、先頭5000文字程度に制限
-            return clean_text[:5000]
-            
+        # 期限内なら覚えておいた HTML を、切れていれば条件付き GET で取り直す
+        # (接続は共有のクライアントを使い回す。リダイレクトも追う)
+        content, content_type = tool_cache.fetch(
+            url, name="visit_web_page", headers=headers)
+        
+        # HTMLからテキストを抽出
+        # (バイト列のまま渡し、文字コードはヘッダーか <meta charset> から判定させる)
+        soup = BeautifulSoup(content, "html.parser",
+                             from_encoding=charset_of(content_type))
+        
+        # scriptやstyleタグを除去
+        for script in soup(["script", "style"]):
+            script.decompose()
+        
+        text = soup.get_text(separator="\n")
+        
+        # 空白行を削除して整形
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        clean_text = "\n".join(lines)
+        
+        # 長すぎるとトークン制限にかかるので、先頭5000文字程度に制限
+        return clean_text[:5000]
+        
     except Exception as e:
         return json.dumps({"error": f"Failed to read page: {str(e)}"})
 
@@ -86,10 +102,20 @@ tools = [
 ]
 
 available_functions = {
-    "web_search": web_search,
+    "web_search": tool_cache.wrap(web_search),
     "visit_web_page": visit_web_page,
 }
 
+# ツールごとのタイムアウト (秒)
+TOOL_TIMEOUTS = {
+    "web_search": 20.0,
+    "visit_web_page": 20.0,
+}
+
+# 会話履歴の予算 (ローカルで見積もったトークン数)
+# 超えたら古いツールの結果を切り詰め、古いターンは要約にまとめる
+history = HistoryManager(max_tokens=8000, tool_output_tokens=300)
+
 def main():
     messages = [
         {"role": "system", "content": """
@@ -105,7 +131,9 @@ def main():
 
     while True:
         user_input = input("\nUser: ").strip()
-        if user_input.lower() == "exit": break
+        if user_input.lower() == "exit":
+            print(f"ツールのキャッシュ: {tool_cache.stats()}")
+            break
         if not user_input: continue
 
         messages.append({"role": "user", "content": user_input})
@@ -113,6 +141,7 @@ def main():
         # --- AIの自律ループ (Agent Loop) ---
         # ユーザーに回答を返すまで、AIが納得するまでツールを使い続けるループ
         while True:
+            messages = history.compact(messages)
             response = client.chat.completions.create(
                 model="gpt-4o",
                 messages=messages,
@@ -127,26 +156,9 @@ def main():
             if tool_calls:
                 messages.append(msg) # 思考履歴を追加
                 
-                for tool_call in tool_calls:
-                    fname = tool_call.function.name
-                    fargs = json.loads(tool_call.function.arguments)
-                    
-                    # 実行
-                    func = available_functions.get(fname)
-                    if func:
-                        # 検索やページ訪問の実行
-                        if fname == "visit_web_page":
-                            result = func(url=fargs["url"])
-                        else:
-                            result = func(**fargs)
-                        
-                        # 結果を履歴に追加
-                        messages.append({
-                            "tool_call_id": tool_call.id,
-                            "role": "tool",
-                            "name": fname,
-                            "content": result
-                        })
+                # 検索やページ訪問を同時に実行し、結果を (元の順番どおりに) 履歴に追加
+                messages.extend(run_tool_calls(
+                    tool_calls, available_functions, timeouts=TOOL_TIMEOUTS))
                 
                 # ループの先頭に戻り、ツールの結果を持った状態でもう一度AIに考えさせる
                 # (まだ情報が足りなければさらにツールを呼ぶし、十分なら回答を生成する)
@@ -0,0 +1,105 @@
+# --- ベクトル化結果のディスクキャッシュ (SQLite) ---
+# (モデル, task_type, title, 次元数, 本文) のハッシュをキーにして結果を保存します。
+# 文書を1件だけ直して再インデックスしても、API を呼ぶのはその1件だけで済みます。
+# 件数の上限を超えたら、最後に使われたのが古いものから捨てます (LRU)。
+# 取り込みパイプラインの embed の段のように、作ったのとは別のスレッドからも使えます。
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from array import array
+
+DEFAULT_PATH = "./embedding_cache.sqlite3"
+
+
+class EmbeddingCache:
+    def __init__(self, path=DEFAULT_PATH, max_entries=100_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # 別のスレッドからも呼ばれるので、接続はロックで守って共有する
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL)")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used"
+            " ON embeddings (last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model, task_type, title, output_dimensionality, text):
+        raw = json.dumps([model, task_type, title, output_dimensionality, text],
+                         ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        """見つかったものだけ {key: ベクトル} で返す"""
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            # SQLite のパラメータ数上限に引っかからないように区切って問い合わせる
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                marks = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({marks})",
+                    chunk)
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found])
+                self._conn.commit()
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items):
+        """(key, ベクトル) の組をまとめて保存する"""
+        now = time.time()
+        rows = [(key, array("f", vector).tobytes(), now) for key, vector in items]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used)"
+                " VALUES (?, ?, ?)", rows)
+            self._evict()
+            self._conn.commit()
+
+    def put(self, key, vector):
+        self.put_many([(key, vector)])
+
+    def _evict(self):
+        (count,) = self._conn.execute(
+            "SELECT COUNT(*) FROM embeddings").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN ("
+                " SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,))
+
+    def stats(self):
+        with self._lock:
+            (count,) = self._conn.execute(
+                "SELECT COUNT(*) FROM embeddings").fetchone()
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": count,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
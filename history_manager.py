@@ -0,0 +1,186 @@
+# --- 会話履歴をトークン数の予算内に収める ---
+# エージェントの messages は増える一方で、visit_web_page の 5000文字のページ本文のような
+# 大きなツールの結果も含めて、毎ターン全部を送り直しています。
+# HistoryManager.compact(messages) は、合計が max_tokens を超えたら次の順で縮めます。
+#   1. 古いターンのツールの結果を、先頭 tool_output_tokens 分だけに切り詰める
+#   2. それでも多ければ、古いターンから順に要約 (rolling summary) に移して履歴から外す
+#   3. それでも多ければ、最新のターンのツールの結果も切り詰める
+# 最初の system メッセージと最新のターンは残します。
+# ターン (user の発言から次の user の発言の手前まで) 単位で外すので、
+# tool_calls を持つ assistant メッセージと、それへの tool の返事が離れることはありません。
+from batch_embedding import estimate_tokens
+
+SUMMARY_PREFIX = "これまでの会話の要約:\n"
+TRUNCATED_MARK = "\n...(省略)"
+
+
+def _field(message, key):
+    """dict でも SDK のメッセージオブジェクトでも値を取り出す"""
+    if isinstance(message, dict):
+        return message.get(key)
+    return getattr(message, key, None)
+
+
+def message_tokens(message, count_tokens=estimate_tokens):
+    """1つのメッセージのざっくりのトークン数 (本文 + ツール呼び出しの引数)"""
+    n = 4  # role などの分
+    content = _field(message, "content")
+    if isinstance(content, str):
+        n += count_tokens(content)
+    for tc in _field(message, "tool_calls") or []:
+        function = _field(tc, "function")
+        n += count_tokens(_field(function, "name") or "")
+        n += count_tokens(_field(function, "arguments") or "")
+    return n
+
+
+def clip_text(text, max_tokens, count_tokens=estimate_tokens, mark=TRUNCATED_MARK):
+    """text を max_tokens に収まるように後ろを切る"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    budget = max(0, max_tokens - count_tokens(mark))
+    end = len(text)
+    while end > 0 and count_tokens(text[:end]) > budget:
+        end = min(end - 1, int(end * budget / count_tokens(text[:end])))
+    return text[:end] + mark
+
+
+def extractive_summary(previous, messages, max_chars=120):
+    """API を呼ばない簡単な要約 (発言ごとに先頭だけを残す)"""
+    lines = [previous] if previous else []
+    for m in messages:
+        role = _field(m, "role")
+        content = _field(m, "content")
+        if role == "user":
+            lines.append(f"ユーザー: {content[:max_chars]}")
+        elif role == "assistant" and content:
+            lines.append(f"AI: {content[:max_chars]}")
+        elif role == "tool":
+            lines.append(f"(ツール {_field(m, 'name') or ''} の結果は省略)")
+    return "\n".join(lines)
+
+
+def openai_summarizer(client, model="gpt-4o-mini", max_tokens=400):
+    """OpenAI のモデルで要約する summarize 関数を作る"""
+    def summarize(previous, messages):
+        transcript = extractive_summary(None, messages, max_chars=1000)
+        response = client.chat.completions.create(
+            model=model,
+            max_tokens=max_tokens,
+            messages=[
+                {"role": "system", "content":
+                 "これまでの要約と会話の続きを、後の会話で必要になる事実・決定事項・"
+                 "ユーザーの要望を落とさずに、簡潔な日本語の箇条書きにまとめてください。"},
+                {"role": "user", "content":
+                 f"これまでの要約:\n{previous or '(なし)'}\n\n会話の続き:\n{transcript}"},
+            ])
+        return response.choices[0].message.content
+    return summarize
+
+
+class HistoryManager:
+    def __init__(self, max_tokens=8000, tool_output_tokens=300,
+                 summary_tokens=600, summarize=extractive_summary,
+                 count_tokens=estimate_tokens):
+        self.max_tokens = max_tokens
+        self.tool_output_tokens = tool_output_tokens
+        self.summary_tokens = summary_tokens
+        self.summarize = summarize  # summarize(これまでの要約, 外すメッセージ) -> 文字列
+        self.count_tokens = count_tokens
+        self.compactions = 0
+        self.truncated_outputs = 0
+        self.summarized_turns = 0
+        self.last_tokens = 0
+
+    def tokens(self, messages):
+        return sum(message_tokens(m, self.count_tokens) for m in messages)
+
+    def _split(self, messages):
+        """(先頭の system メッセージ, 要約, ターンのリスト) に分ける"""
+        head = []
+        summary = None
+        i = 0
+        while i < len(messages) and _field(messages[i], "role") == "system":
+            content = _field(messages[i], "content") or ""
+            if content.startswith(SUMMARY_PREFIX):
+                summary = content[len(SUMMARY_PREFIX):]
+            else:
+                head.append(messages[i])
+            i += 1
+        turns = []
+        for m in messages[i:]:
+            if _field(m, "role") == "user" or not turns:
+                turns.append([])
+            turns[-1].append(m)
+        return head, summary, turns
+
+    def _join(self, head, summary, turns):
+        messages = list(head)
+        if summary:
+            messages.append({"role": "system", "content": SUMMARY_PREFIX + summary})
+        for turn in turns:
+            messages.extend(turn)
+        return messages
+
+    def _truncate_tools(self, turn):
+        """ターン内のツールの結果を切り詰める (減ったトークン数を返す)"""
+        saved = 0
+        for j, m in enumerate(turn):
+            if _field(m, "role") != "tool":
+                continue
+            content = m["content"]
+            clipped = clip_text(content, self.tool_output_tokens, self.count_tokens)
+            if clipped != content:
+                saved += self.count_tokens(content) - self.count_tokens(clipped)
+                turn[j] = {**m, "content": clipped}
+                self.truncated_outputs += 1
+        return saved
+
+    def _clip_summary(self, summary):
+        """要約が summary_tokens を超えたら、古い行 (先頭) から削る"""
+        lines = summary.split("\n")
+        while len(lines) > 1 and self.count_tokens("\n".join(lines)) > self.summary_tokens:
+            lines.pop(0)
+        return clip_text("\n".join(lines), self.summary_tokens, self.count_tokens)
+
+    def compact(self, messages):
+        """予算に収まるように縮めた新しい messages を返す (元のリストは変えない)"""
+        total = self.tokens(messages)
+        if total <= self.max_tokens:
+            self.last_tokens = total
+            return messages
+        self.compactions += 1
+        head, summary, turns = self._split(messages)
+        turns = [list(t) for t in turns]
+
+        # 1. 古いターンのツールの結果を切り詰める
+        for turn in turns[:-1]:
+            if total <= self.max_tokens:
+                break
+            total -= self._truncate_tools(turn)
+
+        # 2. 古いターンを要約に移す
+        if total > self.max_tokens and len(turns) > 1:
+            removed = []
+            while len(turns) > 1 and total > self.max_tokens:
+                turn = turns.pop(0)
+                total -= sum(message_tokens(m, self.count_tokens) for m in turn)
+                removed.extend(turn)
+                self.summarized_turns += 1
+            summary = self._clip_summary(self.summarize(summary, removed))
+
+        # 3. 最新のターンのツールの結果も切り詰める
+        compacted = self._join(head, summary, turns)
+        if self.tokens(compacted) > self.max_tokens and turns:
+            self._truncate_tools(turns[-1])
+            compacted = self._join(head, summary, turns)
+        self.last_tokens = self.tokens(compacted)
+        return compacted
+
+    def stats(self):
+        return {
+            "compactions": self.compactions,
+            "truncated_outputs": self.truncated_outputs,
+            "summarized_turns": self.summarized_turns,
+            "last_tokens": self.last_tokens,
+        }
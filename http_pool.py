@@ -0,0 +1,122 @@
+# pip install httpx   (HTTP/2 も使う場合は pip install "httpx[http2]")
+# --- プロセス全体で使い回す HTTP クライアント ---
+# ツールを呼ぶたびに httpx.Client を作って閉じると、毎回
+# DNS の名前解決 -> TCP 接続 -> TLS ハンドシェイク からやり直しになります。
+# ここで1つだけクライアントを作っておき、すべてのツールがそれを使うことで
+# 接続 (keep-alive) と TLS セッションを使い回します。
+#   - 全体の接続数と keep-alive の数は httpx.Limits で制限
+#   - 同じホストへ同時に投げる数は MAX_PER_HOST までに制限
+#   - タイムアウトは接続 / 読み込みなどを明示的に指定
+#   - h2 パッケージが入っていれば HTTP/2 も使う
+#
+# python http_pool.py で、ローカルのテストサーバーに対して
+# 「毎回クライアントを作る」場合と「使い回す」場合の1回あたりの時間を比べられます。
+import atexit
+import importlib.util
+import threading
+from urllib.parse import urlsplit
+
+import httpx
+
+TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20,
+                      keepalive_expiry=30.0)
+MAX_PER_HOST = 6
+HTTP2 = importlib.util.find_spec("h2") is not None
+
+_client = None
+_lock = threading.Lock()
+_host_slots = {}
+
+
+def get_client():
+    """共有の httpx.Client (最初に呼ばれたときに作る)"""
+    global _client
+    with _lock:
+        if _client is None:
+            _client = httpx.Client(timeout=TIMEOUT, limits=LIMITS,
+                                   http2=HTTP2, follow_redirects=True)
+        return _client
+
+
+def _slot(url):
+    host = urlsplit(str(url)).netloc
+    with _lock:
+        slot = _host_slots.get(host)
+        if slot is None:
+            slot = _host_slots[host] = threading.BoundedSemaphore(MAX_PER_HOST)
+        return slot
+
+
+def request(method, url, **kwargs):
+    """共有クライアントで1回リクエストする (同じホストへの同時実行数は制限つき)"""
+    with _slot(url):
+        return get_client().request(method, url, **kwargs)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def close():
+    global _client
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+atexit.register(close)
+
+
+if __name__ == "__main__":
+    # --- ベンチマーク: ローカルのテストサーバーで1回あたりの時間を比べる ---
+    import statistics
+    import time
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive を受け付ける
+        # ヘッダーと本文が別々に送られるので、Nagle と遅延 ACK で
+        # keep-alive の接続だけ 40ms 待たされないようにする
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            body = b'{"price": "12345.67"}'
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/"
+    N = 300
+
+    def measure(fetch):
+        fetch()  # 1回目 (接続の確立) は除く
+        times = []
+        for _ in range(N):
+            t0 = time.perf_counter()
+            fetch()
+            times.append((time.perf_counter() - t0) * 1000)
+        return statistics.mean(times), statistics.median(times)
+
+    def fresh():
+        with httpx.Client(timeout=10.0) as http:
+            http.get(url).raise_for_status()
+
+    def pooled():
+        get(url).raise_for_status()
+
+    for name, fetch in (("毎回 httpx.Client を作る", fresh),
+                        ("共有クライアント", pooled)):
+        mean, p50 = measure(fetch)
+        print(f"{name}: 平均 {mean:.3f} ms / 中央値 {p50:.3f} ms")
+    print("(ローカルなので TLS と DNS の分は含まれません。"
+          "実際の HTTPS ではさらに差が開きます)")
+    server.shutdown()
@@ -0,0 +1,93 @@
+# --- 差分だけを反映する再インデックス (Chroma) ---
+# ID をリストの位置 (str(i)) にすると、途中に1件挟んだだけで後ろが全部ずれて書き直しになり、
+# 消した文書も DB に残り続けます。そこで
+#   - ID は本文 (+ 埋め込みモデル名) のハッシュにする
+#   - 登録済みの ID を manifest (JSON) に記録しておく
+#   - 今回の文書と manifest を比べて、新しいものだけをベクトル化・登録し、
+#     無くなったものは DB から消す
+# とします。何度実行しても結果は同じで、かかる時間は変更量に比例します。
+import hashlib
+import json
+import os
+
+MANIFEST_FILE = "index_manifest.json"
+
+
+def content_id(text, namespace=""):
+    """本文のハッシュから作る ID (同じ本文・同じモデルなら必ず同じ ID)"""
+    raw = f"{namespace}\0{text}".encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()[:32]
+
+
+def load_manifest(path, collection=None):
+    """登録済み ID の一覧を読む。ファイルが無ければコレクションから作り直す"""
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    if collection is None:
+        return {}
+    return {i: {} for i in collection.get(include=[])["ids"]}
+
+
+def save_manifest(path, manifest):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)  # 途中で落ちても壊れた manifest を残さない
+
+
+def plan_sync(documents, manifest, namespace=""):
+    """(新しく登録する {ID: 本文}, 消す ID のリスト) を返す"""
+    wanted = {}
+    for doc in documents:
+        wanted.setdefault(content_id(doc, namespace), doc)
+    new = {i: doc for i, doc in wanted.items() if i not in manifest}
+    stale = [i for i in manifest if i not in wanted]
+    return new, stale
+
+
+def sync_collection(collection, documents, embed_fn, manifest_path,
+                    namespace="", batch_size=1000, on_batch=None):
+    """documents (文字列のリスト) とコレクションの中身を一致させる
+
+    embed_fn(文字列のリスト) -> ベクトルのリスト は新しい文書にだけ呼ばれます。
+    on_batch(登録済み件数, 登録する件数) はバッチを1つ登録するごとに呼ばれます。
+    embed_fn が None を返した文書は登録しません (manifest にも載らないので次回やり直し)。
+    戻り値は {"added", "failed", "deleted", "unchanged"} の件数です。
+    """
+    manifest = load_manifest(manifest_path, collection)
+    new, stale = plan_sync(documents, manifest, namespace)
+
+    ids = list(new)
+    failed = 0
+    for start in range(0, len(ids), batch_size):
+        batch_ids = ids[start:start + batch_size]
+        batch_docs = [new[i] for i in batch_ids]
+        vectors = embed_fn(batch_docs)
+        # ベクトル化に失敗した (None の) 文書は登録せず、次回の実行で再挑戦する
+        ok = [j for j, v in enumerate(vectors) if v is not None]
+        failed += len(batch_ids) - len(ok)
+        if ok:
+            collection.upsert(ids=[batch_ids[j] for j in ok],
+                              embeddings=[vectors[j] for j in ok],
+                              documents=[batch_docs[j] for j in ok])
+        for j in ok:
+            manifest[batch_ids[j]] = {"preview": batch_docs[j][:20]}
+        save_manifest(manifest_path, manifest)
+        if on_batch is not None:
+            on_batch(start + len(batch_ids), len(ids))
+
+    for start in range(0, len(stale), batch_size):
+        batch_ids = stale[start:start + batch_size]
+        collection.delete(ids=batch_ids)
+        for i in batch_ids:
+            manifest.pop(i, None)
+        save_manifest(manifest_path, manifest)
+
+    save_manifest(manifest_path, manifest)
+    return {
+        "added": len(new) - failed,
+        "failed": failed,
+        "deleted": len(stale),
+        "unchanged": len(manifest) - (len(new) - failed),
+    }
@@ -0,0 +1,232 @@
+# --- 大量の文書を取り込むためのストリーミング・パイプライン ---
+#   (1) ファイルを1つずつ読む       read_documents()
+#   (2) トークン数で区切ったチャンクにする (前後を少し重ねる)  chunk_documents()
+#   (3) まとめてベクトル化する
+#   (4) ベクトルストアに書き込む
+# 各段はジェネレータ / スレッドで、段と段の間は大きさに上限のあるキューでつなぎます。
+# 10ファイルでも10万ファイルでも、途中で抱えるデータ量は変わりません。
+#
+# 使い方:
+#   python ingest_pipeline.py ./docs
+import os
+import queue
+import re
+import sys
+import threading
+import time
+
+from batch_embedding import estimate_tokens
+
+TEXT_EXTENSIONS = (".txt", ".md", ".markdown")
+_DONE = object()  # キューの終わりの目印
+
+
+# --- (1) ファイルの読み込み ---
+def iter_files(paths, extensions=TEXT_EXTENSIONS + (".pdf",)):
+    """ファイルやディレクトリのリストから、対象のファイルのパスを順に返す"""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(extensions):
+                        yield os.path.join(root, name)
+        elif path.lower().endswith(extensions):
+            yield path
+
+
+def read_pdf_text(path):
+    # pip install pypdf
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    return "\n".join(page.extract_text() or "" for page in reader.pages)
+
+
+def read_documents(paths):
+    """{"source", "title", "text"} を1ファイルずつ読んで返す
+
+    txt / markdown はそのまま、PDF は pypdf でテキストを取り出して読みます。
+    (PDF からあらかじめ取り出したテキストは .txt として置いておけば十分です)
+    """
+    for path in iter_files(paths):
+        if path.lower().endswith(".pdf"):
+            text = read_pdf_text(path)
+        else:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                text = f.read()
+        title = os.path.splitext(os.path.basename(path))[0]
+        yield {"source": path, "title": title, "text": text}
+
+
+# --- (2) チャンク分割 ---
+# 文の終わり (。！？ や改行) で区切った単位を、max_tokens を超えないように詰めていく
+_SENTENCE = re.compile(r"[^。．！？!?\n]*(?:[。．！？!?]+|\n+|$)")
+
+
+def split_units(text, max_tokens):
+    """文ごとに区切る。1文だけで max_tokens を超えるものは文字数で切る"""
+    for unit in _SENTENCE.findall(text):
+        if not unit.strip():
+            continue
+        while estimate_tokens(unit) > max_tokens:
+            # 日本語は 1文字 ≒ 1トークンなので、いったん max_tokens 文字で切る
+            cut = max_tokens
+            while cut > 1 and estimate_tokens(unit[:cut]) > max_tokens:
+                cut //= 2
+            yield unit[:cut]
+            unit = unit[cut:]
+        if unit.strip():
+            yield unit
+
+
+def chunk_text(text, max_tokens=400, overlap_tokens=50):
+    """max_tokens 以下のチャンクに分け、隣同士を overlap_tokens ほど重ねる"""
+    units = []   # 今のチャンクに入っている (文, トークン数)
+    tokens = 0
+    for unit in split_units(text, max_tokens):
+        n = estimate_tokens(unit)
+        if units and tokens + n > max_tokens:
+            yield "".join(u for u, _ in units).strip()
+            # 末尾の文を overlap_tokens ぶんだけ次のチャンクに持ち越す
+            keep = []
+            kept = 0
+            for u, m in reversed(units):
+                if kept + m > overlap_tokens or kept + m + n > max_tokens:
+                    break
+                keep.insert(0, (u, m))
+                kept += m
+            units, tokens = keep, kept
+        units.append((unit, n))
+        tokens += n
+    if units:
+        yield "".join(u for u, _ in units).strip()
+
+
+def chunk_documents(docs, max_tokens=400, overlap_tokens=50):
+    """文書ごとにチャンクに分け、{"source", "title", "text", "chunk"} を返す"""
+    for doc in docs:
+        for i, text in enumerate(chunk_text(doc["text"], max_tokens,
+                                            overlap_tokens)):
+            if text:
+                yield {"source": doc["source"], "title": doc["title"],
+                       "text": text, "chunk": i}
+
+
+def batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# --- パイプライン本体 ---
+def _produce(q, items):
+    """items を順にキューへ入れる (キューが一杯なら空くまで待つ)"""
+    try:
+        for item in items:
+            q.put(item)
+    except BaseException as e:
+        q.put(e)
+        return
+    q.put(_DONE)
+
+
+def _consume(q):
+    while True:
+        item = q.get()
+        if item is _DONE:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+
+def run_pipeline(paths, embed_fn, write_fn, batch_size=100, queue_size=4,
+                 max_tokens=400, overlap_tokens=50):
+    """paths のファイルを読み込み、チャンクに分け、ベクトル化して書き込む
+
+    embed_fn(チャンクのリスト) -> ベクトルのリスト
+    write_fn(チャンクのリスト, ベクトルのリスト)
+    読み込み+分割 と ベクトル化 はそれぞれ別スレッドで動き、
+    段の間のキューには最大 queue_size バッチしか溜まりません。
+    戻り値は {"documents", "chunks", "seconds"} です。
+    """
+    stats = {"documents": 0, "chunks": 0}
+
+    def counted_documents():
+        for doc in read_documents(paths):
+            stats["documents"] += 1
+            yield doc
+
+    chunk_batches = batched(
+        chunk_documents(counted_documents(), max_tokens, overlap_tokens),
+        batch_size)
+
+    def embedded():
+        for batch in _consume(to_embed):
+            yield batch, embed_fn(batch)
+
+    to_embed = queue.Queue(maxsize=queue_size)
+    to_write = queue.Queue(maxsize=queue_size)
+    threads = [
+        threading.Thread(target=_produce, args=(to_embed, chunk_batches),
+                         daemon=True),
+        threading.Thread(target=_produce, args=(to_write, embedded()),
+                         daemon=True),
+    ]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for batch, vectors in _consume(to_write):
+        write_fn(batch, vectors)
+        stats["chunks"] += len(batch)
+        print(f"  {stats['chunks']} チャンク書き込み済み"
+              f" ({stats['documents']} ファイル)", end="\r")
+    for t in threads:
+        t.join()
+    stats["seconds"] = time.perf_counter() - t0
+    print()
+    return stats
+
+
+if __name__ == "__main__":
+    # Gemini でベクトル化して、demo_rag_gemini_numpy.py と同じ形式のストアに保存する
+    import tomllib
+
+    from google import genai
+
+    from batch_embedding import embed_documents_gemini
+    from embedding_cache import EmbeddingCache
+    from simple_vector_store import StoreWriter
+
+    with open(".secrets.toml", "rb") as s:
+        secrets = tomllib.load(s)
+    client = genai.Client(api_key=secrets.get("API_KEY"))
+    embedding_cache = EmbeddingCache()
+
+    MODEL = "models/text-embedding-004"
+    STORE_PATH = "./db.my_rag_numpy"
+
+    # バッチごとにディスクへ書き足していくので、メモリはコーパスの大きさに比例せず、
+    # 途中で止まっても書き終えたバッチまではストアとして開けます
+    # (source は demo の documents で上書きされないように)
+    writer = StoreWriter(STORE_PATH, source="ingest_pipeline")
+
+    def embed(chunks):
+        return embed_documents_gemini(client, chunks, MODEL,
+                                      cache=embedding_cache)
+
+    def write(chunks, vectors):
+        writer.add_many([c["title"] for c in chunks],
+                        [c["text"] for c in chunks], vectors)
+        writer.flush()
+
+    with writer:
+        stats = run_pipeline(sys.argv[1:] or ["."], embed, write)
+    print(f"完了。{stats['documents']} ファイル / {stats['chunks']} チャンクを"
+          f" {stats['seconds']:.1f} 秒で '{STORE_PATH}' に保存しました。")
+    print(f"キャッシュ: {embedding_cache.stats()}")
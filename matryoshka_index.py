@@ -0,0 +1,92 @@
+# pip install numpy
+# --- 先頭の次元だけで絞り込む2段階検索 (Matryoshka) ---
+# text-embedding-004 などは、ベクトルの先頭ほど大事な情報が入るように学習されています。
+# (OUTPUT_DIMENSIONALITY で短くできるのはこのため)
+# そこで、全次元のベクトルはそのまま持ちつつ、先頭 prefix_dims 次元だけを
+# 正規化し直した小さな行列も作っておき、
+#   (1) 短いベクトルで k * shortlist 件の候補を選ぶ
+#   (2) 候補だけを全次元のベクトルで並べ直す
+# という順で検索します。
+import time
+
+import numpy as np
+
+from simple_vector_store import normalize, top_k
+
+
+class PrefixIndex:
+    def __init__(self, full_vectors, prefix_dims=128, shortlist=10):
+        # 全次元のベクトル (VectorStore.vectors など。memmap でもよい)
+        self.full_vectors = full_vectors
+        self.prefix_dims = prefix_dims
+        self.shortlist = shortlist
+        # 先頭だけ切り出して、長さ1にそろえ直したもの
+        self.prefix_vectors = normalize(
+            np.asarray(full_vectors[:, :prefix_dims], dtype=np.float32))
+
+    def __len__(self):
+        return len(self.prefix_vectors)
+
+    def search(self, query_vec, k=5, shortlist=None):
+        """上位k件の (行番号の配列, スコアの配列) をスコア降順で返す"""
+        query_vec = np.asarray(query_vec, dtype=np.float32)
+        q_prefix = normalize(query_vec[:self.prefix_dims])[0]
+        n_candidates = k * (shortlist or self.shortlist)
+        candidates, _ = top_k(self.prefix_vectors @ q_prefix, n_candidates)
+        candidates = np.sort(candidates)
+
+        q = normalize(query_vec)[0]
+        scores = np.asarray(self.full_vectors[candidates], dtype=np.float32) @ q
+        idx, scores = top_k(scores, k)
+        return candidates[idx], scores
+
+
+def benchmark(vectors, queries, prefix_sizes=(32, 64, 128, 256), k=10,
+              shortlist=10):
+    """prefix の長さごとに recall@k と 1件あたりの時間を測る
+
+    本物の埋め込み (VectorStore.vectors) と質問ベクトルを渡して、
+    どの長さで絞り込めば十分かを決めるのに使います。
+    戻り値は [{"prefix_dims", "recall", "ms_per_query"}, ...] で、
+    先頭には総当たり (prefix_dims=全次元, recall=1.0) の結果が入ります。
+    """
+    vectors = normalize(vectors)
+    queries = normalize(queries)
+
+    t0 = time.perf_counter()
+    exact = [set(top_k(vectors @ q, k)[0].tolist()) for q in queries]
+    report = [{
+        "prefix_dims": vectors.shape[1],
+        "recall": 1.0,
+        "ms_per_query": (time.perf_counter() - t0) * 1000 / len(queries),
+    }]
+    for prefix_dims in prefix_sizes:
+        if prefix_dims >= vectors.shape[1]:
+            break
+        index = PrefixIndex(vectors, prefix_dims, shortlist)
+        hit = 0
+        t0 = time.perf_counter()
+        for q, truth in zip(queries, exact):
+            idx, _ = index.search(q, k=k)
+            hit += len(truth.intersection(idx.tolist()))
+        report.append({
+            "prefix_dims": prefix_dims,
+            "recall": hit / (k * len(queries)),
+            "ms_per_query": (time.perf_counter() - t0) * 1000 / len(queries),
+        })
+    return report
+
+
+if __name__ == "__main__":
+    # 先頭の次元ほど値が大きい (情報が多い) ランダムなベクトルで試す
+    rng = np.random.default_rng(0)
+    dim = 768
+    decay = 1.0 / np.sqrt(np.arange(1, dim + 1))
+    topics = rng.standard_normal((1000, dim)) * decay
+    data = topics[rng.integers(0, len(topics), 100_000)]
+    data = data + 1.0 * rng.standard_normal(data.shape) * decay
+    queries = data[:100] + 0.1 * rng.standard_normal((100, dim)) * decay
+
+    for row in benchmark(data, queries):
+        print(f"prefix={row['prefix_dims']:4d}  recall@10={row['recall']:.3f}"
+              f"  {row['ms_per_query']:.3f} ms/query")
@@ -1,7 +1,7 @@
 #
 import tomllib
 import google.generativeai as genai
-import requests
+import http_pool
 from bs4 import BeautifulSoup
 import json
 
@@ -21,7 +21,7 @@ def get_google_news_articles(query: str) -> str:
         '(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
     }
 
-    response = requests.get(url, headers=headers)
+    response = http_pool.get(url, headers=headers)
     response.raise_for_status()
 
     soup = BeautifulSoup(response.text, 'html.parser')
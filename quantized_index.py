@@ -0,0 +1,174 @@
+# pip install numpy
+# --- 量子化したベクトルでの検索 + 元のベクトルでの再スコア ---
+# float32 (4バイト/次元) のかわりに、
+#   int8   : 1バイト/次元  (float32 の 1/4, float64 の 1/8)
+#   binary : 1ビット/次元  (符号だけ。float32 の 1/32, float64 の 1/64)
+# で持っておき、まず粗く上位候補を絞り込みます。
+# 絞った候補だけを元の精度のベクトル (memmap でもよい) で計算し直して順位を決めます。
+import os
+
+import numpy as np
+
+from simple_vector_store import normalize, top_k
+
+# 1バイトの中の 1 の数 (np.bitwise_count が無い古い numpy 用)
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount(x):
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(x)
+    return _POPCOUNT[x]
+
+
+class _QuantizedIndex:
+    # 1回の粗いスコア計算で扱う行数
+    BLOCK_SIZE = 65536
+
+    def __init__(self, codes, full_vectors=None, rescore=10, block_size=None):
+        self.codes = codes
+        # 再スコア用の元のベクトル (VectorStore.vectors など)。None なら粗いスコアのまま返す
+        self.full_vectors = full_vectors
+        # 上位k件を決めるために、k * rescore 件を候補として残す
+        self.rescore = rescore
+        self.block_size = block_size or self.BLOCK_SIZE
+
+    def __len__(self):
+        return len(self.codes)
+
+    def memory_bytes(self):
+        return self.codes.nbytes
+
+    def _approx_scores(self, q, block):
+        raise NotImplementedError
+
+    def search(self, query_vec, k=5, rescore=None):
+        """上位k件の (行番号の配列, スコアの配列) をスコア降順で返す"""
+        q = normalize(query_vec)[0]
+        n_candidates = k * (rescore or self.rescore)
+
+        # (1) 粗いスコアで候補を絞る (ブロックごとに計算してメモリを抑える)
+        cand_idx, cand_scores = [], []
+        for start in range(0, len(self.codes), self.block_size):
+            block = self.codes[start:start + self.block_size]
+            idx, scores = top_k(self._approx_scores(q, block), n_candidates)
+            cand_idx.append(idx + start)
+            cand_scores.append(scores)
+        if not cand_idx:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        idx, _ = top_k(np.concatenate(cand_scores), n_candidates)
+        candidates = np.sort(np.concatenate(cand_idx)[idx])
+
+        # (2) 候補だけ元の精度で計算し直す
+        if self.full_vectors is None:
+            scores = self._approx_scores(q, self.codes[candidates])
+        else:
+            scores = np.asarray(self.full_vectors[candidates],
+                                dtype=np.float32) @ q
+        idx, scores = top_k(scores, k)
+        return candidates[idx], scores
+
+
+class Int8Index(_QuantizedIndex):
+    """次元ごとに [-max, max] を [-127, 127] に割り当てるスカラー量子化"""
+
+    # スコアの計算ではブロックを float32 にコピーするので、ブロックは小さくしておく
+    # (4096行 x 768次元 で 12 MiB。検索中も float32 の行列全体ぶんのメモリは使わない)
+    BLOCK_SIZE = 4096
+
+    def __init__(self, codes, scale, full_vectors=None, **kwargs):
+        super().__init__(codes, full_vectors, **kwargs)
+        self.scale = scale  # (dim,) float32
+
+    @classmethod
+    def build(cls, vectors, full_vectors=None, **kwargs):
+        # memmap のままでもよいように、ブロックごとに読んで量子化する
+        # (float32 の行列全体のコピーは作らない)
+        block_size = kwargs.get("block_size") or cls.BLOCK_SIZE
+        n, dim = vectors.shape
+        scale = np.zeros(dim, dtype=np.float32)
+        for start in range(0, n, block_size):
+            block = np.asarray(vectors[start:start + block_size], dtype=np.float32)
+            np.maximum(scale, np.abs(block).max(axis=0), out=scale)
+        scale /= 127.0
+        scale[scale == 0] = 1.0
+        codes = np.empty((n, dim), dtype=np.int8)
+        for start in range(0, n, block_size):
+            block = np.asarray(vectors[start:start + block_size], dtype=np.float32)
+            codes[start:start + len(block)] = np.clip(
+                np.rint(block / scale), -127, 127)
+        return cls(codes, scale, full_vectors, **kwargs)
+
+    def _approx_scores(self, q, block):
+        # (codes * scale) @ q == codes @ (scale * q)
+        return block.astype(np.float32) @ (self.scale * q)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "int8_codes.npy"), self.codes)
+        np.save(os.path.join(path, "int8_scale.npy"), self.scale)
+
+    @classmethod
+    def load(cls, path, full_vectors=None, mmap=True, **kwargs):
+        return cls(np.load(os.path.join(path, "int8_codes.npy"),
+                           mmap_mode="r" if mmap else None),
+                   np.load(os.path.join(path, "int8_scale.npy")),
+                   full_vectors, **kwargs)
+
+
+class BinaryIndex(_QuantizedIndex):
+    """各次元の符号だけを 1ビットで持ち、ハミング距離で比べる"""
+
+    def __init__(self, codes, dim, full_vectors=None, **kwargs):
+        super().__init__(codes, full_vectors, **kwargs)
+        self.dim = dim
+
+    @classmethod
+    def build(cls, vectors, full_vectors=None, **kwargs):
+        block_size = kwargs.get("block_size") or cls.BLOCK_SIZE
+        n, dim = vectors.shape
+        codes = np.empty((n, (dim + 7) // 8), dtype=np.uint8)  # (n, ceil(dim/8))
+        for start in range(0, n, block_size):
+            block = np.asarray(vectors[start:start + block_size])
+            codes[start:start + len(block)] = np.packbits(block > 0, axis=1)
+        return cls(codes, dim, full_vectors, **kwargs)
+
+    def _approx_scores(self, q, block):
+        packed_q = np.packbits(q > 0)
+        hamming = popcount(np.bitwise_xor(block, packed_q)).sum(
+            axis=1, dtype=np.int32)
+        # 距離が小さいほど近いので、 1 - 2*距離/次元 で内積っぽい値に直す
+        return 1.0 - 2.0 * hamming.astype(np.float32) / self.dim
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "binary_codes.npy"), self.codes)
+        np.save(os.path.join(path, "binary_dim.npy"), np.array(self.dim))
+
+    @classmethod
+    def load(cls, path, full_vectors=None, mmap=True, **kwargs):
+        return cls(np.load(os.path.join(path, "binary_codes.npy"),
+                           mmap_mode="r" if mmap else None),
+                   int(np.load(os.path.join(path, "binary_dim.npy"))),
+                   full_vectors, **kwargs)
+
+
+if __name__ == "__main__":
+    import time
+
+    rng = np.random.default_rng(0)
+    topics = rng.standard_normal((1000, 768))
+    data = topics[rng.integers(0, len(topics), 50_000)]
+    data = normalize(data + 0.5 * rng.standard_normal(data.shape))
+    queries = normalize(data[:100] + 0.1 * rng.standard_normal((100, 768)))
+    exact = [set(top_k(data @ q, 10)[0].tolist()) for q in queries]
+
+    print(f"float32: {data.nbytes / 2**20:.1f} MiB")
+    for cls in (Int8Index, BinaryIndex):
+        index = cls.build(data, full_vectors=data)
+        t0 = time.perf_counter()
+        hit = sum(len(truth.intersection(index.search(q, k=10)[0].tolist()))
+                  for q, truth in zip(queries, exact))
+        ms = (time.perf_counter() - t0) * 1000 / len(queries)
+        print(f"{cls.__name__}: {index.memory_bytes() / 2**20:.1f} MiB"
+              f"  recall@10={hit / (10 * len(queries)):.3f}  {ms:.3f} ms/query")
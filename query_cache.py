@@ -0,0 +1,106 @@
+# --- 質問文のベクトルのキャッシュ (プロセス内 LRU) ---
+# エージェントは同じ質問 (や空白・全角半角が違うだけの質問) を何度も投げるので、
+# 質問文を正規化したものとモデル名 (と出力次元数) をキーにして、ベクトルを覚えておきます。
+# persist に EmbeddingCache を渡すと、プロセスをまたいでディスクにも残ります。
+import threading
+import unicodedata
+from collections import OrderedDict
+
+
+def normalize_query(text):
+    """全角/半角・大文字/小文字・前後や連続した空白の違いを吸収する"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return " ".join(text.split())
+
+
+class QueryEmbeddingCache:
+    def __init__(self, max_entries=1024, persist=None):
+        self.max_entries = max_entries
+        self.persist = persist  # EmbeddingCache (任意)
+        self._entries = OrderedDict()
+        # 常駐サーバーなど複数スレッドから使われても壊れないように
+        # (ベクトル化の API 呼び出し自体はロックの外で行います)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _key(self, model, text, output_dimensionality=None):
+        return (model, output_dimensionality, normalize_query(text))
+
+    def _remember(self, key, vector):
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _lookup(self, key):
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector
+        if self.persist is not None:
+            vector = self.persist.get(self._persist_key(key))
+            if vector is not None:
+                self._remember(key, vector)
+                with self._lock:
+                    self.disk_hits += 1
+                return vector
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _store(self, key, vector):
+        self._remember(key, vector)
+        if self.persist is not None:
+            self.persist.put(self._persist_key(key), vector)
+
+    def _persist_key(self, key):
+        model, output_dimensionality, text = key
+        return self.persist.make_key(model, "query", None, output_dimensionality,
+                                     text)
+
+    def get_or_embed(self, model, text, embed_fn, output_dimensionality=None):
+        """キャッシュに無ければ embed_fn(text) を呼んでベクトルを得る
+
+        出力次元数を指定してベクトル化している場合は output_dimensionality も渡します
+        (次元数を変えたときに、前の長さのベクトルを返さないように)。
+        """
+        key = self._key(model, text, output_dimensionality)
+        vector = self._lookup(key)
+        if vector is None:
+            vector = embed_fn(text)
+            self._store(key, vector)
+        return vector
+
+    def get_many_or_embed(self, model, texts, embed_many_fn,
+                          output_dimensionality=None):
+        """複数の質問をまとめて引く。無いものだけを embed_many_fn(リスト) で1回で求める"""
+        keys = [self._key(model, t, output_dimensionality) for t in texts]
+        vectors = [self._lookup(k) for k in keys]
+        missing = {}
+        for i, (key, vector) in enumerate(zip(keys, vectors)):
+            if vector is None:
+                missing.setdefault(key, []).append(i)
+        if missing:
+            first = [positions[0] for positions in missing.values()]
+            for (key, positions), vector in zip(
+                    missing.items(), embed_many_fn([texts[i] for i in first])):
+                self._store(key, vector)
+                for i in positions:
+                    vectors[i] = vector
+        return vectors
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / total if total else 0.0,
+                "entries": len(self._entries),
+            }
@@ -0,0 +1,12 @@
+# --- 検索まわりのベンチマーク ---
+# 合成したベクトルのコーパス (1千件〜1千万件, 次元数は自由) に対して、
+# 各検索方式の 構築時間 / メモリ / 総当たりと比べた recall@k / QPS / 遅延 (p50, p95, p99)
+# を測って JSON で出力します。API は呼ばないので、何度でも同じ条件で測れます。
+#
+# 使い方:
+#   python -m retrieval_bench --sizes 1000 10000 100000 --dim 768 --output bench.json
+#   (--corpus text で、合成した文書を FakeEmbedder でベクトル化したコーパスを使う)
+from retrieval_bench.synthetic import (FakeEmbedder, synthetic_corpus,
+                                       synthetic_queries, synthetic_texts,
+                                       text_corpus)
+from retrieval_bench.runner import BACKENDS, run_benchmark
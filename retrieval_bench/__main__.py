@@ -0,0 +1,46 @@
+import argparse
+import json
+
+from retrieval_bench.runner import BACKENDS, run_benchmark
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m retrieval_bench",
+        description="合成コーパスで検索方式の速度と精度を測る")
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[1000, 10_000, 100_000])
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--backends", nargs="+", choices=sorted(BACKENDS),
+                        default=["numpy", "ivf", "int8", "binary", "prefix"])
+    parser.add_argument("--corpus", choices=["vectors", "text"], default="vectors",
+                        help="vectors: 話題ごとに固まったランダムなベクトル / "
+                             "text: 合成した文書を FakeEmbedder でベクトル化したもの")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--rescore", type=int, default=10)
+    parser.add_argument("--prefix-dims", type=int, default=128)
+    parser.add_argument("--workdir",
+                        help="コーパスを .npy (memmap) として置く場所。"
+                             "RAM に載らない件数を測るときに指定")
+    parser.add_argument("--output", help="結果の JSON の保存先 (省略時は標準出力)")
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        sizes=args.sizes, dim=args.dim, backends=args.backends,
+        n_queries=args.queries, k=args.k, seed=args.seed, workdir=args.workdir,
+        corpus=args.corpus,
+        options={"nprobe": args.nprobe, "rescore": args.rescore,
+                 "prefix_dims": args.prefix_dims})
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
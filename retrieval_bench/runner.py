@@ -0,0 +1,175 @@
+# pip install numpy
+# --- ベンチマーク本体 ---
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from ann_index import IVFIndex
+from matryoshka_index import PrefixIndex
+from quantized_index import BinaryIndex, Int8Index
+from simple_vector_store import VectorStore
+
+
+# --- 各検索方式 ---
+# build(vectors, options) -> search(query_vec, k) を持つオブジェクト
+# どの方式もコーパスをブロックごとに読むので、memmap のコーパス (--workdir) なら
+# RAM に載らない件数でも作れます。ただし作った索引自体は RAM に置きます
+# (int8 は float32 の 1/4、binary は 1/32。IVF の並べ替えたコピーは workdir に書く)。
+def build_numpy(vectors, options):
+    return VectorStore.from_matrix(vectors)
+
+
+def build_ivf(vectors, options):
+    vectors_path = None
+    if isinstance(vectors, np.memmap):
+        # 並べ替えたコピーはコーパスの隣に書く
+        folder, name = os.path.split(vectors.filename)
+        vectors_path = os.path.join(folder, f"ivf_{name}")
+    return IVFIndex.build(vectors, nprobe=options["nprobe"],
+                          vectors_path=vectors_path)
+
+
+def build_int8(vectors, options):
+    return Int8Index.build(vectors, full_vectors=vectors,
+                           rescore=options["rescore"])
+
+
+def build_binary(vectors, options):
+    return BinaryIndex.build(vectors, full_vectors=vectors,
+                             rescore=options["rescore"])
+
+
+def build_prefix(vectors, options):
+    return PrefixIndex(vectors, options["prefix_dims"])
+
+
+class _ChromaBackend:
+    # pip install chromadb
+    MAX_BATCH = 5000
+
+    def __init__(self, vectors):
+        import chromadb
+        client = chromadb.EphemeralClient()
+        name = f"bench_{time.time_ns()}"
+        self.collection = client.create_collection(
+            name=name, metadata={"hnsw:space": "cosine"})
+        for start in range(0, len(vectors), self.MAX_BATCH):
+            block = np.asarray(vectors[start:start + self.MAX_BATCH])
+            self.collection.add(
+                ids=[str(i) for i in range(start, start + len(block))],
+                embeddings=block.tolist())
+
+    def search(self, query_vec, k=5):
+        result = self.collection.query(
+            query_embeddings=[np.asarray(query_vec).tolist()], n_results=k,
+            include=["distances"])
+        ids = np.array([int(i) for i in result["ids"][0]], dtype=np.int64)
+        return ids, 1.0 - np.array(result["distances"][0], dtype=np.float32)
+
+
+def build_chroma(vectors, options):
+    return _ChromaBackend(vectors)
+
+
+BACKENDS = {
+    "numpy": build_numpy,
+    "ivf": build_ivf,
+    "int8": build_int8,
+    "binary": build_binary,
+    "prefix": build_prefix,
+    "chroma": build_chroma,
+}
+
+DEFAULT_OPTIONS = {"nprobe": 8, "rescore": 10, "prefix_dims": 128}
+
+
+def exact_top_k(vectors, queries, k):
+    """総当たりの正解 (行列×行列をブロックごとに計算)"""
+    idx, _ = VectorStore.from_matrix(vectors).search_many(queries, k=k)
+    return idx
+
+
+def measure(backend, vectors, queries, truth, k, options):
+    """1つの検索方式の構築と検索を測る"""
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    index = BACKENDS[backend](vectors, options)
+    build_seconds = time.perf_counter() - t0
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies = np.empty(len(queries))
+    hit = 0
+    for i, (q, expected) in enumerate(zip(queries, truth)):
+        t0 = time.perf_counter()
+        idx, _ = index.search(q, k=k)
+        latencies[i] = time.perf_counter() - t0
+        hit += len(np.intersect1d(idx, expected))
+
+    p50, p95, p99 = np.percentile(latencies * 1000, [50, 95, 99])
+    return {
+        "backend": backend,
+        "build_seconds": build_seconds,
+        "memory_mb": memory / 2**20,
+        "recall_at_k": hit / (k * len(queries)),
+        "qps": len(queries) / latencies.sum(),
+        "latency_ms": {"p50": p50, "p95": p95, "p99": p99},
+    }
+
+
+def load_corpus(n, dim, seed=0, workdir=None, corpus="vectors"):
+    """合成コーパスを用意する。workdir を指定するとディスク上の .npy (memmap) に書く
+
+    corpus="vectors" は話題ごとに固まったランダムなベクトル、
+    corpus="text" は合成した文書を FakeEmbedder でベクトル化したものです。
+    """
+    from retrieval_bench.synthetic import synthetic_corpus, text_corpus
+
+    blocks = {"vectors": synthetic_corpus, "text": text_corpus}[corpus]
+    if workdir is None:
+        return np.concatenate(list(blocks(n, dim, seed=seed)))
+    os.makedirs(workdir, exist_ok=True)
+    path = os.path.join(workdir, f"corpus_{corpus}_{n}_{dim}_{seed}.npy")
+    if not os.path.exists(path):
+        out = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32,
+                                        shape=(n, dim))
+        start = 0
+        for block in blocks(n, dim, seed=seed):
+            out[start:start + len(block)] = block
+            start += len(block)
+        out.flush()
+        del out
+    return np.load(path, mmap_mode="r")
+
+
+def run_benchmark(sizes=(1000, 10_000, 100_000), dim=768,
+                  backends=("numpy", "ivf", "int8", "binary", "prefix"),
+                  n_queries=200, k=10, seed=0, workdir=None, options=None,
+                  corpus="vectors"):
+    """sizes x backends の組み合わせをすべて測り、JSON にできる辞書で返す"""
+    from retrieval_bench.synthetic import synthetic_queries
+
+    options = {**DEFAULT_OPTIONS, **(options or {})}
+    report = {
+        "config": {"sizes": list(sizes), "dim": dim, "backends": list(backends),
+                   "n_queries": n_queries, "k": k, "seed": seed,
+                   "corpus": corpus, **options},
+        "results": [],
+    }
+    for n in sizes:
+        vectors = load_corpus(n, dim, seed=seed, workdir=workdir, corpus=corpus)
+        queries = synthetic_queries(vectors, n_queries, seed=seed + 1)
+        truth = exact_top_k(vectors, queries, k)
+        for backend in backends:
+            row = measure(backend, vectors, queries, truth, k, options)
+            row.update({"n": n, "dim": dim})
+            report["results"].append(row)
+            print(f"n={n:>9} {backend:>7}: recall@{k}={row['recall_at_k']:.3f}"
+                  f"  qps={row['qps']:.0f}"
+                  f"  p99={row['latency_ms']['p99']:.2f}ms"
+                  f"  build={row['build_seconds']:.2f}s"
+                  f"  mem={row['memory_mb']:.1f}MB", file=sys.stderr, flush=True)
+    return report
@@ -0,0 +1,99 @@
+# pip install numpy
+# --- 合成データ ---
+import hashlib
+
+import numpy as np
+
+from bm25_index import ngrams
+from simple_vector_store import normalize
+
+
+class FakeEmbedder:
+    """API を呼ばない、決定的な (同じ文なら必ず同じ結果の) 埋め込み
+
+    文字 n-gram ごとにハッシュで決めた次元へ ±1 を足していく (feature hashing) ので、
+    字面が似ている文ほどベクトルも近くなります。パイプラインの試験用です。
+    """
+
+    def __init__(self, dim=768, seed=0):
+        self.dim = dim
+        self.seed = seed
+
+    def _slot(self, gram):
+        digest = hashlib.blake2b(f"{self.seed}:{gram}".encode("utf-8"),
+                                 digest_size=8).digest()
+        h = int.from_bytes(digest, "little")
+        return h % self.dim, 1.0 if (h >> 63) else -1.0
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for gram in ngrams(text):
+                i, sign = self._slot(gram)
+                vectors[row, i] += sign
+        return normalize(vectors)
+
+    def embed_documents(self, docs):
+        """ingest_pipeline.run_pipeline() の embed_fn としてそのまま使える形"""
+        return self.embed([d["text"] for d in docs])
+
+
+def synthetic_corpus(n, dim=768, n_topics=None, noise=0.5, seed=0,
+                     block_size=100_000):
+    """話題ごとに固まった正規化済みベクトルを block_size 行ずつ返す
+
+    実際の埋め込みに近づけるため、先頭の次元ほど分散を大きくしています
+    (Matryoshka 系のモデルと同じ傾向)。1千万件でも一度にメモリに載せません。
+    """
+    rng = np.random.default_rng(seed)
+    n_topics = n_topics or max(1, int(np.sqrt(n)))
+    decay = (1.0 / np.sqrt(np.arange(1, dim + 1))).astype(np.float32)
+    topics = rng.standard_normal((n_topics, dim), dtype=np.float32) * decay
+    for start in range(0, n, block_size):
+        m = min(block_size, n - start)
+        block = topics[rng.integers(0, n_topics, m)]
+        block += noise * rng.standard_normal((m, dim), dtype=np.float32) * decay
+        yield normalize(block)
+
+
+def synthetic_texts(n, n_topics=None, words_per_doc=20, vocab_size=5000,
+                    topic_words=50, topic_ratio=0.8, seed=0):
+    """話題ごとに使う単語が偏った、ランダムな単語列の文書を n 件作る"""
+    rng = np.random.default_rng(seed)
+    n_topics = n_topics or max(1, int(np.sqrt(n)))
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+    vocab = ["".join(rng.choice(letters, rng.integers(4, 9)))
+             for _ in range(vocab_size)]
+    topics = rng.integers(0, vocab_size, (n_topics, topic_words))
+    for topic in rng.integers(0, n_topics, n):
+        from_topic = rng.random(words_per_doc) < topic_ratio
+        words = np.where(from_topic,
+                         topics[topic][rng.integers(0, topic_words, words_per_doc)],
+                         rng.integers(0, vocab_size, words_per_doc))
+        yield " ".join(vocab[w] for w in words)
+
+
+def text_corpus(n, dim=768, seed=0, block_size=10_000):
+    """synthetic_texts() の文書を FakeEmbedder でベクトル化して block_size 行ずつ返す
+
+    ランダムなベクトルではなく、文字 n-gram の重なりから作った (本物の文書に近い)
+    分布のコーパスで測りたいとき用です。
+    """
+    embedder = FakeEmbedder(dim, seed=seed)
+    block = []
+    for text in synthetic_texts(n, seed=seed):
+        block.append(text)
+        if len(block) == block_size:
+            yield embedder.embed(block)
+            block = []
+    if block:
+        yield embedder.embed(block)
+
+
+def synthetic_queries(corpus, n_queries=100, noise=0.1, seed=1):
+    """コーパスのランダムな行に、長さ noise 程度のノイズを足したものを質問にする"""
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(corpus), min(n_queries, len(corpus)), replace=False)
+    picked = np.asarray(corpus[np.sort(rows)], dtype=np.float32)
+    jitter = rng.standard_normal(picked.shape, dtype=np.float32)
+    return normalize(picked + noise * jitter / np.sqrt(picked.shape[1]))
@@ -0,0 +1,151 @@
+# --- 常駐する検索サーバー (localhost HTTP) ---
+# エージェントのプロセスを起動するたびに chromadb.PersistentClient を開いて
+# コレクションを読み込むと、その分だけ起動も最初の検索も遅くなります。
+# このサーバーを1つ立てておけば、コレクションと質問ベクトルのキャッシュは温まったまま、
+# エージェント側は HTTP で問い合わせるだけの薄いクライアントで済みます。
+#
+# 起動:
+#   python retrieval_server.py            (127.0.0.1:8765 で待ち受け)
+# API:
+#   POST /search  {"query": "...", "n_results": 2}  -> {"documents": [...], "distances": [...]}
+#   GET  /stats                                     -> キャッシュのヒット率など
+import json
+import sys
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HOST = "127.0.0.1"
+PORT = 8765
+DB_PATH = "./my_rag_db"
+COLLECTION = "company_knowledge"
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+
+class Retriever:
+    """コレクションと OpenAI クライアントを開いたまま持っておく"""
+
+    def __init__(self, db_path=DB_PATH, collection=COLLECTION,
+                 model=EMBEDDING_MODEL):
+        import chromadb
+        from openai import OpenAI
+
+        from query_cache import QueryEmbeddingCache
+        from semantic_cache import SemanticCache
+
+        self.client = OpenAI()
+        self.collection = chromadb.PersistentClient(
+            path=db_path).get_collection(name=collection)
+        self.model = model
+        self.query_cache = QueryEmbeddingCache(max_entries=4096)
+        # 言い回しが違うだけの質問には、前回の検索結果をそのまま返す
+        self.result_cache = SemanticCache(threshold=0.95, max_entries=4096,
+                                          ttl=600.0)
+        self.queries = 0
+        self.seconds = 0.0
+
+    def _embed(self, text):
+        resp = self.client.embeddings.create(input=text, model=self.model)
+        return resp.data[0].embedding
+
+    def search(self, query, n_results=2):
+        t0 = time.perf_counter()
+        vector = self.query_cache.get_or_embed(self.model, query, self._embed)
+        body = self.result_cache.lookup(vector)
+        if body is None or len(body["documents"]) < n_results:
+            results = self.collection.query(query_embeddings=[vector],
+                                            n_results=n_results)
+            body = {"documents": results["documents"][0],
+                    "distances": results["distances"][0]}
+            self.result_cache.put(vector, body)
+        self.queries += 1
+        self.seconds += time.perf_counter() - t0
+        return {"documents": body["documents"][:n_results],
+                "distances": body["distances"][:n_results]}
+
+    def stats(self):
+        return {
+            "queries": self.queries,
+            "avg_ms": self.seconds * 1000 / self.queries if self.queries else 0.0,
+            "query_cache": self.query_cache.stats(),
+            "result_cache": self.result_cache.stats(),
+        }
+
+
+def make_handler(retriever):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive で接続を使い回せるように
+
+        def _send(self, status, body):
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self._send(200, retriever.stats())
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/search":
+                self._send(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                body = retriever.search(request["query"],
+                                        int(request.get("n_results", 2)))
+            except Exception as e:
+                self._send(500, {"error": str(e)})
+                return
+            self._send(200, body)
+
+        def log_message(self, format, *args):
+            pass  # 1リクエストごとのログは出さない
+
+    return Handler
+
+
+class RetrievalClient:
+    """サーバーに問い合わせる薄いクライアント (標準ライブラリだけで動く)"""
+
+    def __init__(self, url=f"http://{HOST}:{PORT}", timeout=10.0):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def search(self, query, n_results=2):
+        """見つかった文書のリストを返す。サーバーに繋がらなければ OSError"""
+        data = json.dumps({"query": query, "n_results": n_results}).encode("utf-8")
+        request = urllib.request.Request(
+            self.url + "/search", data=data,
+            headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as resp:
+            return json.loads(resp.read())["documents"]
+
+    def stats(self):
+        with urllib.request.urlopen(self.url + "/stats",
+                                    timeout=self.timeout) as resp:
+            return json.loads(resp.read())
+
+
+def serve(host=HOST, port=PORT):
+    print("コレクションを読み込み中...")
+    retriever = Retriever()
+    server = ThreadingHTTPServer((host, port), make_handler(retriever))
+    print(f"検索サーバーを起動しました: http://{host}:{port}"
+          f" ({retriever.collection.count()} 件)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"終了します。{retriever.stats()}")
+
+
+if __name__ == "__main__":
+    serve(port=int(sys.argv[1]) if len(sys.argv) > 1 else PORT)
@@ -0,0 +1,80 @@
+# pip install numpy
+# --- 意味の近さで引くキャッシュ (semantic cache) ---
+# 「リモートワークは何時までに申請？」と「リモートの申請期限っていつ？」のように、
+# 言い回しが違うだけの質問は、質問ベクトル同士のコサイン類似度がとても高くなります。
+# 新しい質問のベクトルが、覚えている質問のどれかと threshold 以上に近ければ、
+# そのときの結果 (検索結果や最終回答) をそのまま返します。
+#   - ttl 秒を過ぎたものは使わない
+#   - max_entries を超えたら、期限切れ -> 最後に使われたのが古いもの の順に捨てる
+import threading
+import time
+
+import numpy as np
+
+from simple_vector_store import normalize
+
+
+class SemanticCache:
+    def __init__(self, threshold=0.95, max_entries=1000, ttl=3600.0):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._matrix = None   # (max_entries, dim) の正規化済みベクトル
+        self._values = [None] * max_entries
+        self._created = np.full(max_entries, -np.inf)
+        self._last_used = np.full(max_entries, -np.inf)
+        self._used = np.zeros(max_entries, dtype=bool)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return int(self._live(time.time()).sum())
+
+    def _live(self, now):
+        return self._used & (now - self._created <= self.ttl)
+
+    def lookup(self, vector):
+        """十分に近い質問があればその値を、無ければ None を返す"""
+        q = normalize(vector)[0]
+        now = time.time()
+        with self._lock:
+            if self._matrix is None:
+                self.misses += 1
+                return None
+            scores = np.where(self._live(now), self._matrix @ q, -np.inf)
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            self._last_used[best] = now
+            self.hits += 1
+            return self._values[best]
+
+    def put(self, vector, value):
+        q = normalize(vector)[0]
+        now = time.time()
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, len(q)),
+                                        dtype=np.float32)
+            # 空き -> 期限切れ -> 最後に使われたのが一番古いもの の順に上書きする
+            free = np.flatnonzero(~self._live(now))
+            if len(free):
+                slot = int(free[0])
+            else:
+                slot = int(np.argmin(self._last_used))
+            self._matrix[slot] = q
+            self._values[slot] = value
+            self._created[slot] = now
+            self._last_used[slot] = now
+            self._used[slot] = True
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self),
+        }
@@ -0,0 +1,574 @@
+# pip install numpy
+import hashlib
+import heapq
+import json
+import mmap
+import os
+import struct
+from array import array
+
+import numpy as np
+
+VECTORS_FILE = "vectors.npy"  # float32 の (n, dim) 行列
+META_FILE = "meta.json"       # 件数・次元数・中身のハッシュなど (小さい)
+DOCS_FILE = "docs.jsonl"      # 1行に1件の {"title", "text"}
+DOC_OFFSETS_FILE = "docs_offsets.npy"  # 各行が docs.jsonl の何バイト目から始まるか
+METADATA_FILE = "metadata.json"        # MetadataIndex の (属性名, 値) の一覧
+METADATA_ROWS_FILE = "metadata_rows.npy"
+METADATA_OFFSETS_FILE = "metadata_offsets.npy"
+FINGERPRINT_FILE = "store_fingerprint.json"  # 派生した索引がどのストアから作られたか
+
+
+# --- 自作ベクトルストア (行列版) ---
+# ベクトルは L2 正規化した float32 で、1本の連続した行列にまとめて持ちます。
+# 正規化済み同士なら「内積 = コサイン類似度」なので、検索は
+# 行列×ベクトルの1回の計算 + argpartition で上位k件を取り出すだけです。
+# (件数が 5件 -> 数百万件 になっても Python のループは回りません)
+class VectorStore:
+    # 1回の計算で扱う行数。これより大きいストアはブロックごとに流して検索します。
+    BLOCK_SIZE = 65536
+
+    def __init__(self, dim=None, capacity=1024):
+        self.dim = dim
+        self._capacity = capacity
+        self._matrix = None  # (capacity, dim) の float32 行列
+        self._size = 0
+        # 行番号と対応する並列配列
+        self.titles = []
+        self.texts = []
+        # title などの値 -> 行番号 (絞り込み検索用)
+        self.metadata = MetadataIndex()
+        # どこから作ったストアか (例: "documents")。meta.json に一緒に保存される
+        self.source = None
+        self._content = None  # load() したときの中身のハッシュ (読み直さずに済むように)
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def vectors(self):
+        """登録済みの行だけを切り出したビュー (コピーはしない)"""
+        if self._matrix is None:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return self._matrix[:self._size]
+
+    def _reserve(self, n):
+        # 足りなくなったら倍々で確保し直す (追加のたびにコピーしないため)
+        # memmap で開いたストアに追加した場合も、ここでメモリ上にコピーされます
+        if self._matrix is None:
+            cap = max(self._capacity, n)
+            self._matrix = np.empty((cap, self.dim), dtype=np.float32)
+            return
+        if n <= len(self._matrix):
+            return
+        cap = len(self._matrix)
+        while cap < n:
+            cap *= 2
+        grown = np.empty((cap, self.dim), dtype=np.float32)
+        grown[:self._size] = self._matrix[:self._size]
+        self._matrix = grown
+
+    def add(self, title, text, vector):
+        self.add_many([title], [text], [vector])
+
+    def add_many(self, titles, texts, vectors):
+        mat = normalize(vectors)
+        if len(titles) != len(mat) or len(texts) != len(mat):
+            raise ValueError("titles / texts / vectors の件数が一致しません")
+        if self.dim is None:
+            self.dim = mat.shape[1]
+        elif mat.shape[1] != self.dim:
+            raise ValueError(f"次元数が違います: {mat.shape[1]} != {self.dim}")
+
+        if not isinstance(self.titles, list):
+            # load() したストアに追加する場合は、title / text をメモリに読み込む
+            self.titles, self.texts = list(self.titles), list(self.texts)
+        self._content = None
+        self._reserve(self._size + len(mat))
+        self._matrix[self._size:self._size + len(mat)] = mat
+        for row, title in enumerate(titles, start=self._size):
+            self.metadata.add(row, title=title)
+        self._size += len(mat)
+        self.titles.extend(titles)
+        self.texts.extend(texts)
+
+    def search(self, query_vec, k=5, block_size=None, rows=None, where=None):
+        """上位k件の (行番号の配列, スコアの配列) をスコア降順で返す
+
+        行数が block_size を超える場合は、ブロックごとにスコアを計算して
+        上位k件だけをヒープに残します (memmap でもメモリに全部載せずに済む)。
+        rows (行番号の配列) を渡すと、その行だけを計算します。
+        where (例: {"title": "交通費規定"}) を渡すと、条件に合う行だけを計算します。
+        """
+        if self._size == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        q = normalize(query_vec)[0]
+        if where:
+            matched = self.metadata.rows(**where)
+            rows = matched if rows is None else np.intersect1d(matched, rows)
+        if rows is not None:
+            rows = np.asarray(rows, dtype=np.int64)
+            idx, scores = top_k(self._matrix[rows] @ q, k)
+            return rows[idx], scores
+        block_size = block_size or self.BLOCK_SIZE
+        if self._size <= block_size:
+            scores = self.vectors @ q
+            return top_k(scores, k)
+
+        heap = []  # (score, 行番号) の最小ヒープ。常に上位k件だけを持つ
+        for start in range(0, self._size, block_size):
+            block = self._matrix[start:min(start + block_size, self._size)]
+            idx, scores = top_k(block @ q, k)
+            for i, score in zip(idx, scores):
+                item = (float(score), start + int(i))
+                if len(heap) < k:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+        heap.sort(reverse=True)
+        return (np.array([i for _, i in heap], dtype=np.int64),
+                np.array([s for s, _ in heap], dtype=np.float32))
+
+    def score_rows(self, query_vec, rows):
+        """指定した行だけのコサイン類似度 (rows と同じ順番)"""
+        q = normalize(query_vec)[0]
+        return self._matrix[np.asarray(rows, dtype=np.int64)] @ q
+
+    def search_many(self, query_vecs, k=5, block_size=None):
+        """複数の質問をまとめて検索する
+
+        (質問数, dim) の行列を1回の行列×行列で計算し、
+        (質問数, k) の行番号の配列とスコアの配列を返します (各行はスコア降順)。
+        """
+        queries = normalize(query_vecs)
+        k = min(k, self._size)
+        if k == 0:
+            return (np.empty((len(queries), 0), dtype=np.int64),
+                    np.empty((len(queries), 0), dtype=np.float32))
+        block_size = block_size or self.BLOCK_SIZE
+        best_idx = best_scores = None
+        for start in range(0, self._size, block_size):
+            block = self._matrix[start:min(start + block_size, self._size)]
+            idx, scores = top_k_rows(queries @ block.T, k)
+            idx += start
+            if best_idx is not None:
+                # これまでの上位k件とこのブロックの上位k件を合わせて、上位k件を残す
+                idx = np.concatenate([best_idx, idx], axis=1)
+                scores = np.concatenate([best_scores, scores], axis=1)
+                keep, scores = top_k_rows(scores, k)
+                idx = np.take_along_axis(idx, keep, axis=1)
+            best_idx, best_scores = idx, scores
+        return best_idx, best_scores
+
+    def get(self, i, score=None):
+        item = {"title": self.titles[i], "text": self.texts[i]}
+        if score is not None:
+            item["score"] = float(score)
+        return item
+
+    def fingerprint(self):
+        """件数・次元数・中身 (title / text) のハッシュ
+
+        IVF や量子化などの派生した索引と一緒に保存しておき、
+        ストアが作り直されていたら索引も作り直すために使います。
+        """
+        content = self._content or content_digest(self.titles, self.texts)
+        return {"count": self._size, "dim": self.dim, "content": content}
+
+    # --- 保存と読み込み ---
+    def save(self, path):
+        """path ディレクトリにベクトル (.npy) と title / text (JSONL) を書き出す
+
+        中身は StoreWriter と同じ形式で、ブロックごとに書くので
+        書き出しのために全件分の JSON を組み立てることはありません。
+        """
+        target = os.path.join(path, VECTORS_FILE)
+        if (isinstance(self._matrix, np.memmap) and os.path.exists(target)
+                and os.path.samefile(self._matrix.filename, target)):
+            # 開いたままのファイルを上書きすると、読んでいる途中の中身が壊れる
+            raise ValueError(f"{path} から読み込んだストアを同じ場所には保存できません")
+        block_size = self.BLOCK_SIZE
+        with StoreWriter(path, self.dim, self.source) as writer:
+            for start in range(0, self._size, block_size):
+                end = min(start + block_size, self._size)
+                writer._write(self.titles[start:end], self.texts[start:end],
+                              self._matrix[start:end])
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """save() したストアを開く
+
+        mmap=True ならベクトルは np.memmap として開くだけで読み込みません。
+        title / text も行ごとの位置だけを持ち、使うときに docs.jsonl から読みます。
+        (起動は一瞬で、RAM より大きいコーパスも検索できます)
+        """
+        with open(os.path.join(path, META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        count = meta["count"]
+        matrix = np.load(os.path.join(path, VECTORS_FILE),
+                         mmap_mode="r" if mmap else None)
+        if matrix.dtype != np.float32 or len(matrix) < count:
+            raise ValueError(f"{path} のベクトルと付随情報が一致しません")
+        if "titles" in meta:
+            # 前の形式 (title / text を meta.json にまとめて持っていた)
+            store = cls.from_matrix(matrix[:count], meta["titles"], meta["texts"])
+            store.source = meta.get("source")
+            return store
+
+        store = cls(dim=meta["dim"])
+        # 書き込み途中で止まったストアは、ヘッダーの件数が meta.json より多いことがある
+        store._matrix = matrix[:count]
+        store._size = count
+        docs = _DocFile(path, count)
+        store.titles = _DocColumn(docs, "title")
+        store.texts = _DocColumn(docs, "text")
+        store.source = meta.get("source")
+        store._content = meta.get("content")
+        store.metadata = MetadataIndex.load(path, count)
+        if store.metadata is None:
+            # 索引を書く前に止まったストア。title を読み直して作る
+            store.metadata = MetadataIndex()
+            for row, title in enumerate(store.titles):
+                store.metadata.add(row, title=title)
+        return store
+
+    @classmethod
+    def from_matrix(cls, matrix, titles=None, texts=None):
+        """正規化済みの float32 の (n, dim) 行列を、コピーせずにそのまま使うストアを作る
+
+        memmap でもかまいません。titles / texts を省略すると空文字になります。
+        """
+        if matrix.dtype != np.float32 or matrix.ndim != 2:
+            raise ValueError("float32 の (n, dim) 行列を渡してください")
+        n = len(matrix)
+        titles = list(titles) if titles is not None else [""] * n
+        texts = list(texts) if texts is not None else [""] * n
+        if len(titles) != n or len(texts) != n:
+            raise ValueError("titles / texts / vectors の件数が一致しません")
+        store = cls(dim=matrix.shape[1])
+        store._matrix = matrix
+        store._size = n
+        store.titles = titles
+        store.texts = texts
+        for row, title in enumerate(titles):
+            store.metadata.add(row, title=title)
+        return store
+
+
+def _doc_line(title, text):
+    """docs.jsonl の1行 (改行などは JSON の中でエスケープされるので必ず1行になる)"""
+    return (json.dumps({"title": title, "text": text}, ensure_ascii=False)
+            + "\n").encode("utf-8")
+
+
+def content_digest(titles, texts):
+    """title / text の並びのハッシュ (並び順も含めて同じなら同じ値)
+
+    docs.jsonl の中身のハッシュと同じ値なので、書きながら少しずつ計算できます。
+    """
+    digest = hashlib.sha256()
+    for title, text in zip(titles, texts):
+        digest.update(_doc_line(title, text))
+    return digest.hexdigest()
+
+
+# --- 行を書き足していける .npy ---
+# .npy のヘッダーには行数が入っているので、ヘッダーの長さを固定にしておき、
+# 行を末尾に書き足したあとでヘッダーだけを書き直します。
+_NPY_HEADER_SIZE = 128
+
+
+def _npy_header(dtype, shape):
+    header = repr({"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                   "fortran_order": False, "shape": tuple(shape)}).encode("latin1")
+    magic = np.lib.format.magic(1, 0)
+    pad = _NPY_HEADER_SIZE - len(magic) - 2 - len(header) - 1
+    return (magic + struct.pack("<H", len(header) + pad + 1)
+            + header + b" " * pad + b"\n")
+
+
+class _NpyAppender:
+    def __init__(self, path, dtype, row_shape=()):
+        self.dtype = np.dtype(dtype)
+        self.row_shape = tuple(row_shape)
+        self.count = 0
+        self._file = open(path, "wb")
+        self._file.write(_npy_header(self.dtype, (0,) + self.row_shape))
+
+    def append(self, rows):
+        rows = np.ascontiguousarray(rows, dtype=self.dtype)
+        self._file.write(rows.tobytes())
+        self.count += len(rows)
+
+    def flush(self):
+        self._file.flush()
+        end = self._file.tell()
+        self._file.seek(0)
+        self._file.write(_npy_header(self.dtype, (self.count,) + self.row_shape))
+        self._file.seek(end)
+        self._file.flush()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+
+class StoreWriter:
+    """VectorStore.load() で開ける形式のストアを、少しずつディスクに書いていく
+
+    add_many() ごとにベクトルは vectors.npy の末尾に、title / text は docs.jsonl の
+    末尾に書き足すので、メモリに残るのは行ごとの位置と title の索引だけです。
+    flush() するとそこまでの分が load() で開けるようになります
+    (途中で止まっても、最後に flush() した所までは残る)。
+    close() で title の索引も書き出して完了です。
+
+        with StoreWriter("./db.my_rag_numpy", source="ingest_pipeline") as writer:
+            for titles, texts, vectors in batches:
+                writer.add_many(titles, texts, vectors)
+                writer.flush()
+    """
+
+    def __init__(self, path, dim=None, source=None):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.dim = dim
+        self.source = source
+        self.metadata = MetadataIndex()
+        self._vectors = None  # 次元数が決まってから開く
+        self._docs = open(os.path.join(path, DOCS_FILE), "wb")
+        self._offsets = _NpyAppender(os.path.join(path, DOC_OFFSETS_FILE), np.int64)
+        self._offsets.append([0])
+        self._digest = hashlib.sha256()
+        self._bytes = 0
+        if dim is not None:
+            self._open_vectors()
+
+    def __len__(self):
+        return self._offsets.count - 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _open_vectors(self):
+        self.dim = self.dim or 0  # 1件も無いまま閉じる場合は (0, 0)
+        self._vectors = _NpyAppender(os.path.join(self.path, VECTORS_FILE),
+                                     np.float32, (self.dim,))
+
+    def add_many(self, titles, texts, vectors):
+        mat = normalize(vectors)
+        if len(titles) != len(mat) or len(texts) != len(mat):
+            raise ValueError("titles / texts / vectors の件数が一致しません")
+        if self.dim is None:
+            self.dim = mat.shape[1]
+        elif mat.shape[1] != self.dim:
+            raise ValueError(f"次元数が違います: {mat.shape[1]} != {self.dim}")
+        self._write(titles, texts, mat)
+
+    def _write(self, titles, texts, mat):
+        # mat は正規化済みの float32 (n, dim)
+        if self._vectors is None:
+            self._open_vectors()
+        start = len(self)
+        ends = []
+        for title, text in zip(titles, texts):
+            line = _doc_line(title, text)
+            self._docs.write(line)
+            self._digest.update(line)
+            self._bytes += len(line)
+            ends.append(self._bytes)
+        self._vectors.append(mat)
+        self._offsets.append(ends)
+        for row, title in enumerate(titles, start=start):
+            self.metadata.add(row, title=title)
+
+    def flush(self):
+        """ここまでの分を load() で開けるようにする"""
+        if self._vectors is None:
+            self._open_vectors()
+        self._docs.flush()
+        self._offsets.flush()
+        self._vectors.flush()
+        # meta.json は最後に書く (件数は meta.json のものが正しい)
+        tmp = os.path.join(self.path, META_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "count": len(self),
+                       "source": self.source,
+                       "content": self._digest.hexdigest()}, f)
+        os.replace(tmp, os.path.join(self.path, META_FILE))
+
+    def close(self):
+        if self._docs.closed:
+            return
+        self.flush()
+        self.metadata.save(self.path, len(self))
+        self._docs.close()
+        self._offsets.close()
+        self._vectors.close()
+
+
+class _DocFile:
+    """docs.jsonl を mmap して、行番号で1件ずつ読む"""
+
+    def __init__(self, path, count):
+        offsets = np.load(os.path.join(path, DOC_OFFSETS_FILE), mmap_mode="r")
+        if len(offsets) < count + 1:
+            raise ValueError(f"{path} の docs_offsets と件数が一致しません")
+        self.offsets = offsets[:count + 1]
+        self.count = count
+        self._mmap = None
+        if self.offsets[-1] > 0:
+            with open(os.path.join(path, DOCS_FILE), "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def row(self, i):
+        if not -self.count <= i < self.count:
+            raise IndexError(i)
+        i %= self.count
+        return json.loads(self._mmap[self.offsets[i]:self.offsets[i + 1]])
+
+
+class _DocColumn:
+    """_DocFile の title か text だけを、読み取り専用のリストのように見せる"""
+
+    def __init__(self, docs, field):
+        self._docs = docs
+        self._field = field
+
+    def __len__(self):
+        return self._docs.count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return self._docs.row(int(i))[self._field]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def save_fingerprint(path, fingerprint):
+    """派生した索引のディレクトリに、元のストアの fingerprint() を書いておく"""
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, FINGERPRINT_FILE), "w", encoding="utf-8") as f:
+        json.dump(fingerprint, f)
+
+
+def load_fingerprint(path):
+    """save_fingerprint() で書いた値 (無ければ None)"""
+    try:
+        with open(os.path.join(path, FINGERPRINT_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class MetadataIndex:
+    """属性の値ごとに、その値を持つ行番号の配列をあらかじめ作っておく
+
+    絞り込み検索のときに全件のスコアを計算してから捨てるのではなく、
+    最初から条件に合う行だけを計算するために使います。
+    """
+
+    def __init__(self):
+        self._rows = {}  # (属性名, 値) -> 行番号の array (昇順)
+
+    def add(self, row, **attrs):
+        for field, value in attrs.items():
+            rows = self._rows.get((field, value))
+            if not isinstance(rows, array):
+                # load() したもの (numpy の配列) は、書き足せるように array にする
+                rows = self._rows[(field, value)] = array("q", [] if rows is None
+                                                          else rows.tolist())
+            rows.append(row)
+
+    def save(self, path, count):
+        """(属性名, 値) の一覧と、行番号を並べてつないだ配列 + 区切り位置に分けて書く"""
+        keys = list(self._rows)
+        lengths = [len(self._rows[key]) for key in keys]
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        rows = np.empty(offsets[-1], dtype=np.int64)
+        for key, start, end in zip(keys, offsets[:-1], offsets[1:]):
+            rows[start:end] = np.frombuffer(self._rows[key], dtype=np.int64)
+        np.save(os.path.join(path, METADATA_ROWS_FILE), rows)
+        np.save(os.path.join(path, METADATA_OFFSETS_FILE), offsets)
+        with open(os.path.join(path, METADATA_FILE), "w", encoding="utf-8") as f:
+            json.dump({"count": count, "keys": keys}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path, count):
+        """save() したものを読む (無いか、件数 count の時のものでなければ None)"""
+        try:
+            with open(os.path.join(path, METADATA_FILE), encoding="utf-8") as f:
+                meta = json.load(f)
+            rows = np.load(os.path.join(path, METADATA_ROWS_FILE))
+            offsets = np.load(os.path.join(path, METADATA_OFFSETS_FILE))
+        except (OSError, ValueError):
+            return None
+        if meta["count"] != count:
+            return None
+        index = cls()
+        for (field, value), start, end in zip(meta["keys"], offsets[:-1],
+                                              offsets[1:]):
+            index._rows[(field, value)] = rows[start:end]
+        return index
+
+    def values(self, field):
+        return [v for f, v in self._rows if f == field]
+
+    def rows(self, **where):
+        """条件に合う行番号の配列 (昇順)
+
+        値にリストなどを渡すとそのどれか (OR)、属性を複数渡すと全部 (AND) です。
+        """
+        result = None
+        for field, value in where.items():
+            choices = value if isinstance(value, (list, tuple, set)) else [value]
+            matched = np.empty(0, dtype=np.int64)
+            for v in choices:
+                found = self._rows.get((field, v))
+                if found is not None:
+                    matched = np.union1d(
+                        matched, np.frombuffer(found, dtype=np.int64))
+            result = matched if result is None else np.intersect1d(
+                result, matched, assume_unique=True)
+        return result if result is not None else np.empty(0, dtype=np.int64)
+
+    def mask(self, n, **where):
+        """条件に合う行だけ True の長さ n の配列"""
+        mask = np.zeros(n, dtype=bool)
+        mask[self.rows(**where)] = True
+        return mask
+
+
+def normalize(vectors):
+    """(n, dim) の float32 行列にして、各行を長さ1にそろえる"""
+    mat = np.asarray(vectors, dtype=np.float32)
+    if mat.ndim == 1:
+        mat = mat[None, :]
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+def top_k(scores, k):
+    """全体をソートせずに上位k件だけ取り出す (argpartition は O(n))"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=scores.dtype)
+    idx = np.argpartition(-scores, k - 1)[:k]
+    idx = idx[np.argsort(-scores[idx])]
+    return idx, scores[idx]
+
+
+def top_k_rows(scores, k):
+    """(質問数, n) のスコア行列の各行から上位k件を取り出す"""
+    k = min(k, scores.shape[1])
+    idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part = np.take_along_axis(scores, idx, axis=1)
+    order = np.argsort(-part, axis=1)
+    return (np.take_along_axis(idx, order, axis=1),
+            np.take_along_axis(part, order, axis=1))
@@ -0,0 +1,41 @@
+# --- ストリーミング応答の表示と時間計測 ---
+# 回答が全部そろうのを待たずに、届いた分から順に表示します。
+# 使う人が「速い」と感じるのは最初の1文字が出るまでの時間 (TTFT) なので、
+# それと全体の時間を記録して返します。
+import time
+
+
+def print_stream(chunks, started=None, prefix="Gemini: "):
+    """chunk.text を届いた順に表示し、(全文, 計測結果) を返す
+
+    started には、リクエストを投げる直前の time.perf_counter() を渡します。
+    (省略すると、この関数を呼んだ時点から測ります)
+    計測結果は {"ttft": 最初の文字までの秒数, "total": 全体の秒数} です。
+    google-genai の generate_content_stream() でも、
+    google.generativeai の send_message(..., stream=True) でも使えます。
+    """
+    if started is None:
+        started = time.perf_counter()
+    ttft = None
+    parts = []
+    print(prefix, end="", flush=True)
+    for chunk in chunks:
+        try:
+            text = chunk.text or ""
+        except ValueError:
+            # google.generativeai は本文の無いチャンク (終了理由だけ等) で例外になる
+            continue
+        if not text:
+            continue
+        if ttft is None:
+            ttft = time.perf_counter() - started
+        print(text, end="", flush=True)
+        parts.append(text)
+    total = time.perf_counter() - started
+    print()
+    return "".join(parts), {"ttft": ttft, "total": total}
+
+
+def format_timing(timing):
+    ttft = "-" if timing["ttft"] is None else f"{timing['ttft']:.2f}s"
+    return f"最初の文字まで {ttft} / 全体 {timing['total']:.2f}s"
@@ -0,0 +1,219 @@
+# --- ネットワークを使うツールの結果のキャッシュ (TTL + 条件付き GET) ---
+# モデルは同じ get_bitcoin_price や同じ URL の visit_web_page を、
+# 1ターンの中でも何度も呼ぶことがあります。そのたびに外へ取りに行かないように、
+# (ツール名, 引数) をキーにして結果を覚えておきます。
+#   - ツールごとに有効期限 (TTL) を決める (価格は数十秒、ページは数分 など)
+#   - ページは ETag / Last-Modified も覚えておき、期限が切れたら条件付き GET で確認する
+#     (変わっていなければ 304 が返るので、本文を取り直さずに期限だけ延ばす)
+#   - ページの本文は文字コードを決めつけずにバイト列のまま、Content-Type と一緒に覚える
+#     (Shift_JIS などのページも、<meta charset> を読む BeautifulSoup に任せられるように)
+#   - メモリ (LRU) に置き、path を指定すると SQLite のファイルにも保存する
+#     (ファイルの方も max_disk_entries を超えたら、最後に使われたのが古いものから捨てる)
+#   - 同じキーの呼び出しが同時に来たら、1つだけが取りに行き、残りはその結果を使う
+#   - エラーの結果 ({"error": ...}) は覚えない
+import functools
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from email.message import Message
+
+import http_pool
+
+DEFAULT_TTL = 60.0
+
+
+def charset_of(content_type):
+    """Content-Type ヘッダーの charset (無ければ None)"""
+    if not content_type:
+        return None
+    message = Message()
+    message["Content-Type"] = content_type
+    return message.get_content_charset()
+
+
+def _is_error(value):
+    try:
+        data = json.loads(value)
+    except (TypeError, ValueError):
+        return False
+    return isinstance(data, dict) and "error" in data
+
+
+class ToolResultCache:
+    def __init__(self, ttls=None, default_ttl=DEFAULT_TTL, max_entries=1000,
+                 path=None, max_disk_entries=10_000):
+        self.ttls = dict(ttls or {})  # ツール名 -> 秒数
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        # key -> {"value", "expires", "etag", "last_modified", "content_type"}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = [threading.Lock() for _ in range(64)]
+        self._conn = None
+        if path:
+            # ツールはスレッドプールから呼ばれるので、接続はロックで守って共有する
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS tool_results ("
+                " key TEXT PRIMARY KEY,"
+                " value BLOB NOT NULL,"
+                " expires REAL NOT NULL,"
+                " etag TEXT,"
+                " last_modified TEXT,"
+                " content_type TEXT,"
+                " last_used REAL NOT NULL DEFAULT 0)")
+            columns = [row[1] for row in
+                       self._conn.execute("PRAGMA table_info(tool_results)")]
+            if "last_used" not in columns:  # 前の版で作ったファイル
+                self._conn.execute("ALTER TABLE tool_results"
+                                   " ADD COLUMN last_used REAL NOT NULL DEFAULT 0")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS tool_results_last_used"
+                " ON tool_results (last_used)")
+            self._conn.commit()
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(name, arguments):
+        raw = json.dumps([name, arguments], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def ttl_for(self, name):
+        return self.ttls.get(name, self.default_ttl)
+
+    def _key_lock(self, key):
+        return self._key_locks[int(key[:8], 16) % len(self._key_locks)]
+
+    def _load(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+            if self._conn is None:
+                return None
+            row = self._conn.execute(
+                "SELECT value, expires, etag, last_modified, content_type"
+                " FROM tool_results WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE tool_results SET last_used = ? WHERE key = ?",
+                    (time.time(), key))
+                self._conn.commit()
+        if row is None:
+            return None
+        entry = dict(zip(
+            ("value", "expires", "etag", "last_modified", "content_type"), row))
+        self._remember(key, entry, persist=False)
+        return entry
+
+    def _remember(self, key, entry, persist=True):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            if persist and self._conn is not None:
+                now = time.time()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO tool_results"
+                    " (key, value, expires, etag, last_modified, content_type,"
+                    "  last_used)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, entry["value"], entry["expires"], entry["etag"],
+                     entry["last_modified"], entry["content_type"], now))
+                # 確かめようのない期限切れはすぐ捨てる
+                self._conn.execute("DELETE FROM tool_results WHERE expires < ?"
+                                   " AND etag IS NULL AND last_modified IS NULL",
+                                   (now,))
+                self._evict()
+                self._conn.commit()
+
+    def _evict(self):
+        (count,) = self._conn.execute(
+            "SELECT COUNT(*) FROM tool_results").fetchone()
+        if count > self.max_disk_entries:
+            self._conn.execute(
+                "DELETE FROM tool_results WHERE key IN ("
+                " SELECT key FROM tool_results ORDER BY last_used LIMIT ?)",
+                (count - self.max_disk_entries,))
+
+    def call(self, name, func, arguments):
+        """期限内の結果があればそれを、無ければ func(**arguments) の結果を返す"""
+        key = self.make_key(name, arguments)
+        with self._key_lock(key):
+            entry = self._load(key)
+            if entry is not None and entry["expires"] > time.time():
+                self.hits += 1
+                return entry["value"]
+            self.misses += 1
+            value = func(**arguments)
+            if isinstance(value, str) and not _is_error(value):
+                self._remember(key, {"value": value,
+                                     "expires": time.time() + self.ttl_for(name),
+                                     "etag": None, "last_modified": None,
+                                     "content_type": None})
+            return value
+
+    def wrap(self, func, name=None):
+        """ツール関数をキャッシュ付きにする (available_functions に入れる用)"""
+        name = name or func.__name__
+
+        @functools.wraps(func)
+        def cached(**arguments):
+            return self.call(name, func, arguments)
+        return cached
+
+    def fetch(self, url, name="fetch", headers=None):
+        """URL の (本文のバイト列, Content-Type) を返す。期限切れなら条件付き GET で確かめる"""
+        key = self.make_key(name, {"url": url})
+        with self._key_lock(key):
+            entry = self._load(key)
+            now = time.time()
+            if entry is not None and entry["expires"] > now:
+                self.hits += 1
+                return entry["value"], entry["content_type"]
+            request_headers = dict(headers or {})
+            if entry is not None:
+                if entry["etag"]:
+                    request_headers["If-None-Match"] = entry["etag"]
+                if entry["last_modified"]:
+                    request_headers["If-Modified-Since"] = entry["last_modified"]
+            resp = http_pool.get(url, headers=request_headers)
+            if resp.status_code == 304 and entry is not None:
+                self.revalidated += 1
+                self._remember(key, {**entry, "expires": now + self.ttl_for(name)})
+                return entry["value"], entry["content_type"]
+            resp.raise_for_status()
+            self.misses += 1
+            content_type = resp.headers.get("Content-Type")
+            if "no-store" not in resp.headers.get("Cache-Control", ""):
+                self._remember(key, {
+                    "value": resp.content,
+                    "expires": now + self.ttl_for(name),
+                    "etag": resp.headers.get("ETag"),
+                    "last_modified": resp.headers.get("Last-Modified"),
+                    "content_type": content_type,
+                })
+            return resp.content, content_type
+
+    def stats(self):
+        total = self.hits + self.revalidated + self.misses
+        return {
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.revalidated) / total if total else 0.0,
+            "entries": len(self._entries),
+        }
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
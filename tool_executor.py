@@ -0,0 +1,139 @@
+# --- 複数のツール呼び出しを並行して実行する ---
+# gpt-4o は1回の応答で複数の tool_calls を返すことがあります (並列呼び出し)。
+# for 文で1つずつ実行すると、ページ3つの取得なら3つ分の時間を足した待ち時間になります。
+# ここではスレッドプールで同時に実行し、1ターンの待ち時間を「一番遅い呼び出し」にします。
+#   - ツールごとにタイムアウトを指定できる (超えたらエラーの結果を返す)
+#     タイムアウトはプールの空きを待っている間ではなく、ツールが動き出した時から数える
+#   - executor を渡すと、共有のプールではなくそのプールで動かす
+#     (会話が多いプログラムでは、ランタイムごとに同時実行数に合わせたプールを持たせる)
+#     Python のスレッドは外から止められないので、タイムアウトしたツールも
+#     終わるまではプールのスレッドを1つ使い続けることに注意
+#   - 結果の tool メッセージは、元の tool_calls の順番どおりに返す
+# asyncio のプログラムからは run_tool_calls_async を使います (async def のツールも呼べる)。
+import asyncio
+import inspect
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+DEFAULT_TIMEOUT = 30.0
+
+# executor を渡さなかったときに使い回すスレッドプール
+# (with で毎回作ると、タイムアウトしたスレッドの終了を待ってしまうため)
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="tool")
+
+
+def _call(func, arguments, on_start=None):
+    if on_start is not None:
+        on_start()  # プールのスレッドで動き出した合図
+    return func(**json.loads(arguments or "{}"))
+
+
+def _tool_message(tool_call, content):
+    return {
+        "tool_call_id": tool_call.id,
+        "role": "tool",
+        "name": tool_call.function.name,
+        "content": content,
+    }
+
+
+def run_tool_calls(tool_calls, available_functions, timeouts=None,
+                   default_timeout=DEFAULT_TIMEOUT, executor=None):
+    """tool_calls を並行して実行し、履歴に追加する tool メッセージのリストを返す
+
+    timeouts はツール名 -> 秒数 の辞書です (無いものは default_timeout)。
+    知らないツール・例外・タイムアウトの場合も、エラー内容を content に入れた
+    tool メッセージを返します (tool_call_id ごとに必ず1つ返事が必要なため)。
+    """
+    timeouts = timeouts or {}
+    executor = executor or _executor
+    pending = []
+    for tool_call in tool_calls:
+        name = tool_call.function.name
+        func = available_functions.get(name)
+        if func is None:
+            pending.append((tool_call, None, None))
+            continue
+        print(f"[System] Tool Calling: {name} ...")
+        started = {"event": threading.Event(), "at": None}
+
+        def on_start(started=started):
+            started["at"] = time.monotonic()
+            started["event"].set()
+
+        pending.append((tool_call, started, executor.submit(
+            _call, func, tool_call.function.arguments, on_start)))
+
+    messages = []
+    for tool_call, started, future in pending:
+        name = tool_call.function.name
+        if future is None:
+            content = json.dumps({"error": f"unknown tool: {name}"})
+        else:
+            try:
+                # 締め切りはツールが動き出した時点から数える
+                # (プールの空き待ちの間は数えない。並行して待っている時間は含む)
+                started["event"].wait()
+                deadline = started["at"] + timeouts.get(name, default_timeout)
+                content = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                future.cancel()
+                print(f"[System] Tool Timeout: {name}")
+                content = json.dumps({"error": f"{name} timed out"})
+            except Exception as e:
+                content = json.dumps({"error": str(e)})
+        messages.append(_tool_message(tool_call, content))
+    return messages
+
+
+async def _call_async(func, arguments, timeout, executor):
+    if inspect.iscoroutinefunction(func):
+        return await asyncio.wait_for(
+            func(**json.loads(arguments or "{}")), timeout)
+    # 普通の関数はスレッドプールで動かし、イベントループを止めない
+    loop = asyncio.get_running_loop()
+    started = loop.create_future()
+
+    def on_start():
+        loop.call_soon_threadsafe(
+            lambda: started.done() or started.set_result(None))
+
+    future = loop.run_in_executor(executor, _call, func, arguments, on_start)
+    # プールの空きを待っている間はタイムアウトに数えない
+    # (ツールがすぐに失敗した場合は、合図より先に結果が出ることもある)
+    try:
+        await asyncio.wait([started, future], return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        future.cancel()  # まだ動き出していなければ取り消せる
+        raise
+    return await asyncio.wait_for(future, timeout)
+
+
+async def run_tool_calls_async(tool_calls, available_functions, timeouts=None,
+                               default_timeout=DEFAULT_TIMEOUT, executor=None):
+    """run_tool_calls の asyncio 版 (返す tool メッセージは同じ形)"""
+    timeouts = timeouts or {}
+    executor = executor or _executor
+
+    async def run_one(tool_call):
+        name = tool_call.function.name
+        func = available_functions.get(name)
+        if func is None:
+            return _tool_message(
+                tool_call, json.dumps({"error": f"unknown tool: {name}"}))
+        print(f"[System] Tool Calling: {name} ...")
+        try:
+            content = await _call_async(func, tool_call.function.arguments,
+                                        timeouts.get(name, default_timeout),
+                                        executor)
+        except asyncio.TimeoutError:
+            print(f"[System] Tool Timeout: {name}")
+            content = json.dumps({"error": f"{name} timed out"})
+        except Exception as e:
+            content = json.dumps({"error": str(e)})
+        return _tool_message(tool_call, content)
+
+    return list(await asyncio.gather(*(run_one(tc) for tc in tool_calls)))